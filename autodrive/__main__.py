@@ -1,7 +1,5 @@
 import json
 import logging
-import logging.handlers
-import time
 from argparse import ArgumentParser
 from pathlib import Path
 
@@ -14,6 +12,9 @@ def run(config):
     refresh_token = _d(config["refresh_token"])
     p_cookies = {k: _d(v) for k, v in config["pixiv"]["cookies"].items()}
     pixiv_drive = PixivDrive()
+    if config.get("cache_dir"):
+        pixiv_drive.s_pixiv.enable_cache(Path(config["cache_dir"], "pixiv"))
+        pixiv_drive.s_adrive.enable_path_cache(Path(config["cache_dir"], "aliyundrive_paths.json"))
     if not pixiv_drive.login(refresh_token=refresh_token, p_cookies=p_cookies):
         logger.error("Failed to login, run failed.")
     else:
@@ -21,6 +22,13 @@ def run(config):
         # exit(-1)
         pixiv_drive.upload_monthly_ranking(include_user_top=True)
         logger.info("Task completed.")
+        if pixiv_drive.s_pixiv.hedger:
+            logger.info("Pixiv hedge stats: {}".format(pixiv_drive.s_pixiv.hedge_stats()))
+        if pixiv_drive.s_pixiv.cache:
+            logger.info("Pixiv cache stats: {}".format(pixiv_drive.s_pixiv.cache_stats()))
+        if pixiv_drive.s_adrive.path_cache:
+            logger.info("Drive path cache stats: {}".format(pixiv_drive.s_adrive.path_cache.stats()))
+            pixiv_drive.s_adrive.path_cache.save()
 
         # XXX: update refresh_token to config
         config["refresh_token"] = _e(pixiv_drive.s_adrive.refresh_token or refresh_token)
@@ -36,25 +44,28 @@ if __name__ == "__main__":
     parser.add_argument("--test", action="store_true", default=False)
     args = parser.parse_args()
 
-    # logging config
-    root_logger = logging.getLogger()
-    fmter = logging.Formatter("{asctime} - {levelname} - {filename} - {lineno} - {message}", "%Y-%m-%d %H:%M:%S", "{")
-    fmter.converter = time.gmtime
+    # logging config, records are written in background
     if not args.test:
-        root_logger.setLevel(logging.WARNING)  # avoid big log file
-        hdler = logging.handlers.RotatingFileHandler("logs/autodrive.txt", maxBytes=2**20, backupCount=2, encoding="utf8")
+        hdler = utils.logsetup.rotating_file_handler("logs/autodrive.txt")  # WARNING level to avoid big log file
     else:
-        root_logger.setLevel(logging.WARNING)
         hdler = logging.StreamHandler()
-    hdler.setFormatter(fmter)
-    root_logger.addHandler(hdler)
 
     ####### DEBUG #######
     debug_hdl = logging.StreamHandler()
-    debug_hdl.setFormatter(fmter)
-    root_logger.addHandler(debug_hdl)
     #####################
 
+    log_listener = utils.logsetup.setup_logging([hdler, debug_hdl], logging.WARNING)
+
+    # resolve and connect while config is read and decrypted
+    utils.xsession.XSession.enable_dns_cache()
+    utils.xsession.registry.prewarm({
+        "aliyundrive": ["api.aliyundrive.com"],
+        "pixiv": ["www.pixiv.net", "i.pximg.net"],
+    })
+
+    # autodrive and bilibot divide one pixiv budget when running at the same time
+    utils.xsession.get_session("pixiv", warm=False).enable_shared_rate_limit("tmp/xsession_ratelimit.sqlite3")
+
     # read secrets
     def _e(p): return utils.secrets.aes256_enc_cbc(p, args.runkey)
     def _d(c): return utils.secrets.aes256_dec_cbc(c, args.runkey)
@@ -63,10 +74,17 @@ if __name__ == "__main__":
     with Path(args.config).open("r", encoding="utf8") as f:
         config: dict = json.load(f)
 
-    run(config)
+    # jobs are killed after 6 hours by default, stop uploads earlier to leave time for saving progress and commit
+    with utils.xsession.timeout.deadline(5 * 3600):
+        run(config)
+    logger.info("Connection stats: {}".format(utils.xsession.registry.connection_stats()))
+
+    # export request metrics of this run, not committed by workflow
+    Path("tmp/autodrive.metrics.json").write_text(utils.xsession.metrics.default_metrics.to_json(indent=4), encoding="utf8")
 
     # save config
     with Path(args.config).open("w", encoding="utf8") as f:
         json.dump(config, f, ensure_ascii=False, indent=4)
 
+    log_listener.stop()
     logging.shutdown()
@@ -5,6 +5,9 @@ from os import PathLike
 from pathlib import Path
 import re
 import shutil
+import threading
+import time
+from typing import List
 
 from utils import media, xsession
 
@@ -25,10 +28,19 @@ class PixivDrive:
         """
         self.logger = logging.getLogger(__name__)
 
-        self.s_adrive = xsession.AliyunDrive()
-        self.s_pixiv = xsession.Pixiv()
-        self.s_adrive.headers.update(self.headers)
-        self.s_pixiv.headers.update(self.headers)
+        self.s_adrive = xsession.get_session("aliyundrive", headers=self.headers)
+        self.s_pixiv = xsession.get_session("pixiv", headers=self.headers)
+        if not self.s_pixiv.hedger:
+            self.s_pixiv.enable_hedging(0.95, hosts=("*.pximg.net",))  # page downloads have long tail
+        if not self.s_pixiv.single_flight:
+            self.s_pixiv.enable_single_flight()
+
+        # illusts are uploaded in parallel, throttled by feedback of both pixiv and aliyundrive
+        if not self.s_pixiv.concurrency_limiter:
+            self.s_pixiv.enable_concurrency_limit(initial=2, max_limit=8)
+        self.s_adrive.concurrency_limiter = self.s_pixiv.concurrency_limiter
+        self._user_locks = {}
+        self._user_locks_lock = threading.Lock()
 
         # # DEBUG
         # self.s_pixiv.proxies.update(self.proxies)
@@ -90,6 +102,17 @@ class PixivDrive:
             return False
 
         user_id = illust_info["userId"]
+
+        # illusts of the same user are uploaded one by one, so their folders are not created twice
+        with self._get_user_lock(user_id):
+            return self._upload_illust(illust_id, illust_info)
+
+    def _get_user_lock(self, user_id: str) -> threading.Lock:
+        with self._user_locks_lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+    def _upload_illust(self, illust_id: str, illust_info: dict) -> bool:
+        user_id = illust_info["userId"]
         username = illust_info["userName"]
 
         # root_dir/user_id
@@ -121,9 +144,9 @@ class PixivDrive:
         if not page_local_paths:
             return False
 
-        # add salt to avoid same hash
+        # add salt to avoid same hash, seeded by page so a page downloaded again resumes its unfinished upload
         for path in page_local_paths:
-            if not media.img_add_salt(path, random_salt=True):
+            if not media.img_add_salt(path):
                 self.logger.warning("Failed to add salt to page {}, upload original page.".format(path.as_posix()))
             self.s_adrive.upload_file(
                 user_dir.joinpath(illust_id, path.name),
@@ -156,6 +179,49 @@ class PixivDrive:
 
         return True
 
+    def is_healthy(self) -> bool:
+        """Whether all hosts used by pixiv and aliyundrive sessions are not circuit broken."""
+        return self.s_pixiv.is_host_healthy() and self.s_adrive.is_host_healthy()
+
+    def _wait_healthy(self, timeout: float = 300) -> bool:
+        """Wait until unhealthy hosts can be probed again."""
+        deadline = time.monotonic() + timeout
+        while not self.is_healthy():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(5)
+        return True
+
+    def _upload_illusts(self, illust_ids: List[str]) -> bool:
+        """Upload illusts in parallel under concurrency limit of sessions.
+
+        Illusts met unhealthy hosts are deferred to the end instead of piling up timeouts,
+        and uploaded one by one after hosts recovered, or skipped if hosts still not recovered after waiting.
+        """
+        # create root folder before user folders are created in parallel
+        self.s_adrive.create_folder(self.root_dir)
+
+        def _upload(id_: str):
+            if not self.is_healthy():
+                return None  # deferred
+            return self.upload_illust(id_)
+
+        results = self.s_pixiv.concurrency_limiter.map(_upload, illust_ids)
+        flag = all(result is not False for result in results)
+        deferred = [id_ for id_, result in zip(illust_ids, results) if result is None]
+        self.logger.info("Concurrency of uploads: {}".format(self.s_pixiv.concurrency_stats()))
+
+        if deferred:
+            self.logger.warning("{} illusts deferred by unhealthy hosts.".format(len(deferred)))
+        for i, id_ in enumerate(deferred):
+            if not self._wait_healthy():
+                self.logger.error("Hosts still unhealthy, skip {} deferred illusts.".format(len(deferred) - i))
+                return False
+            if not self.upload_illust(id_):
+                flag = False
+
+        return flag
+
     def upload_monthly_ranking(
         self,
         *,
@@ -173,14 +239,8 @@ class PixivDrive:
             return False
 
         # upload ranking illusts
-        illust_ids = [str(e["illust_id"]) for e in ranking_info["contents"]]
-        flag = True
-        # print("##### DEBUG 1 BEGIN #####", flush=True)
-        for id_ in illust_ids:
-            # print(id_, end=";", flush=True)
-            if not self.upload_illust(id_):
-                flag = False
-        # print("\n##### DEBUG 1 END #####", flush=True)
+        ranking_illust_ids = [str(e["illust_id"]) for e in ranking_info["contents"]]
+        flag = self._upload_illusts(ranking_illust_ids)
 
         if not flag:
             self.logger.warning("Failed to upload some illusts.")
@@ -188,7 +248,7 @@ class PixivDrive:
         # upload users in ranking top illusts
         if include_user_top:
             illust_ids = set()
-            user_ids = [e["user_id"] for e in ranking_info["contents"]]
+            user_ids = list(dict.fromkeys(e["user_id"] for e in ranking_info["contents"]))  # users may have several illusts in ranking
             # print("##### DEBUG 2 BEGIN #####", flush=True)
             for id_ in user_ids:
                 # print(id_, end=";", flush=True)
@@ -198,6 +258,9 @@ class PixivDrive:
                         illust_ids.add(str(illust_id))
             # print("\n##### DEBUG 2 END #####", flush=True)
 
+            # ranking illusts have been uploaded
+            illust_ids.difference_update(ranking_illust_ids)
+
             # shuffle
             illust_ids = list(illust_ids)
             for _ in range(1000):
@@ -209,11 +272,7 @@ class PixivDrive:
             # print(illust_ids)
             # print("Num: ", len(illust_ids), flush=True)
 
-            flag = True
-            for id_ in illust_ids:
-                # print(id_, end=";", flush=True)
-                if not self.upload_illust(id_):
-                    flag = False
+            flag = self._upload_illusts(illust_ids)
             # print("\n##### DEBUG 3 END #####", flush=True)
             if not flag:
                 self.logger.warning("Failed to upload some user top illusts.")
@@ -1,7 +1,5 @@
 import json
 import logging
-import logging.handlers
-import time
 from argparse import ArgumentParser
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -114,6 +112,16 @@ if __name__ == "__main__":
     parser.add_argument("--test", action="store_true", default=False)
     args = parser.parse_args()
 
+    # resolve and connect while config is read and decrypted
+    utils.xsession.XSession.enable_dns_cache()
+    utils.xsession.registry.prewarm({
+        "bilibili": ["api.bilibili.com", "api.vc.bilibili.com"],
+        "pixiv": ["www.pixiv.net", "i.pximg.net"],
+    })
+
+    # autodrive and bilibot divide one pixiv budget when running at the same time
+    utils.xsession.get_session("pixiv", warm=False).enable_shared_rate_limit("tmp/xsession_ratelimit.sqlite3")
+
     # read config
     with Path(args.config).open("r", encoding="utf8") as f:
         config: dict = json.load(f)
@@ -121,24 +129,19 @@ if __name__ == "__main__":
     # read secrets
     def _d(c): return utils.secrets.aes256_dec_cbc(c, args.runkey)
 
-    # logging config
-    root_logger = logging.getLogger()
-    fmter = logging.Formatter("{asctime} - {levelname} - {filename} - {lineno} - {message}", "%Y-%m-%d %H:%M:%S", "{")
-    fmter.converter = time.gmtime
-
+    # logging config, records are written in background
     if not args.test:
-        # logging config
-        root_logger.setLevel(logging.INFO)
-        hdler = logging.handlers.RotatingFileHandler("logs/bilibot.txt", maxBytes=2**20, backupCount=2, encoding="utf8")
-        hdler.setFormatter(fmter)
-        root_logger.addHandler(hdler)
-        run(config)
+        log_listener = utils.logsetup.setup_logging([utils.logsetup.rotating_file_handler("logs/bilibot.txt")], logging.INFO)
+        # scheduled every 2 hours, finish before next run starts
+        with utils.xsession.timeout.deadline(100 * 60):
+            run(config)
     else:
-        # logging config
-        root_logger.setLevel(logging.WARNING)
-        hdler = logging.StreamHandler()
-        hdler.setFormatter(fmter)
-        root_logger.addHandler(hdler)
+        log_listener = utils.logsetup.setup_logging([logging.StreamHandler()], logging.WARNING)
         test(config)
 
+    logger.info("Connection stats: {}".format(utils.xsession.registry.connection_stats()))
+
+    # export request metrics of this run, not committed by workflow
+    Path("tmp/bilibot.metrics.json").write_text(utils.xsession.metrics.default_metrics.to_json(indent=4), encoding="utf8")
+    log_listener.stop()
     logging.shutdown()
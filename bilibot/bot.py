@@ -17,8 +17,9 @@ class Bot:
     }
 
     def __init__(self) -> None:
-        self.s_bili = xsession.Bilibili()
-        self.s_bili.headers.update(self.headers)
+        self.s_bili = xsession.get_session("bilibili", headers=self.headers)
+        if not self.s_bili.single_flight:
+            self.s_bili.enable_single_flight(10)  # dynamic detail is checked several times in a row
         self.logger = logging.getLogger(__name__)
 
     def _get_safe_pixiv_illust_ids(
@@ -67,8 +68,7 @@ class Bot:
                     return False
             return True
 
-        s_pixiv = xsession.Pixiv()
-        s_pixiv.headers.update(self.headers)
+        s_pixiv = xsession.get_session("pixiv", headers=self.headers)
 
         # DEBUG
         # s_pixiv.proxies.update(self.proxies)
@@ -160,21 +160,20 @@ class Bot:
         Returns
             dict: song save path and infos, `name`, `artist`, `local_path`
         """
-        s_kuwo = xsession.KuwoMusic()
-        s_kuwo.headers.update(self.headers)
+        s_kuwo = xsession.get_session("kuwomusic", headers=self.headers)
         id_ = random.choice(playlist)
 
         # BUG
         raise NotImplementedError
 
         song_info = s_kuwo.get_music_info(id_)
-        song_data = s_kuwo.get_song_data(id_)
-        if not song_info or not song_data:
+        if not song_info:
             return {}
 
         # cache file to local
         cache_path = Path("tmp/bgm.mp3")
-        cache_path.write_bytes(song_data)
+        if not s_kuwo.download_song(id_, cache_path):
+            return {}
         result = {
             "name": song_info.get("name"),
             "artist": song_info.get("artist"),
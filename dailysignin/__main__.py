@@ -2,8 +2,7 @@
 
 import json
 import logging
-import logging.handlers
-import time
+import threading
 from argparse import ArgumentParser
 from base64 import b64decode
 from pathlib import Path
@@ -40,18 +39,16 @@ if __name__ == "__main__":
     parser.add_argument("--test", action="store_true", default=False)
     args = parser.parse_args()
 
-    # logging config
-    root_logger = logging.getLogger()
-    fmter = logging.Formatter("{asctime} - {levelname} - {filename} - {lineno} - {message}", "%Y-%m-%d %H:%M:%S", "{")
-    fmter.converter = time.gmtime
+    # logging config, records are written in background
     if not args.test:
-        root_logger.setLevel(logging.INFO)
-        hdler = logging.handlers.RotatingFileHandler("logs/dailysignin.txt", maxBytes=2**20, backupCount=2, encoding="utf8")
+        log_listener = utils.logsetup.setup_logging([utils.logsetup.rotating_file_handler("logs/dailysignin.txt")], logging.INFO)
     else:
-        root_logger.setLevel(logging.WARNING)
-        hdler = logging.StreamHandler()
-    hdler.setFormatter(fmter)
-    root_logger.addHandler(hdler)
+        log_listener = utils.logsetup.setup_logging([logging.StreamHandler()], logging.WARNING)
+
+    # resolve sites while config is read and decrypted, each signer has its own session so only dns is shared
+    dns_cache = utils.xsession.XSession.enable_dns_cache()
+    sites = [m.Signer.site_name for m in (kkwcy_com, www_hmoe11_net, jike0_com, ssru6_pw, freevpn_cyou, dash_pepsicola_me)]
+    threading.Thread(target=dns_cache.prewarm, args=(sites,), daemon=True).start()
 
     # read config
     with Path(args.config).open("r", encoding="utf8") as f:
@@ -60,6 +57,12 @@ if __name__ == "__main__":
     # read secrets
     def _d(c): return utils.secrets.aes256_dec_cbc(c, args.runkey)
 
-    run(config)
+    # a stuck site should not hold the daily job
+    with utils.xsession.timeout.deadline(30 * 60):
+        run(config)
+
+    # export request metrics of this run, not committed by workflow
+    Path("tmp/dailysignin.metrics.json").write_text(utils.xsession.metrics.default_metrics.to_json(indent=4), encoding="utf8")
 
+    log_listener.stop()
     logging.shutdown()
@@ -0,0 +1,66 @@
+# -*- coding: UTF-8 -*-
+
+"""Offline regression check and benchmark of signers, with responses replayed instead of network.
+
+Run from anywhere: python3 scripts/replaytest/script.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parents[2].as_posix())
+
+from dailysignin import kkwcy_com
+from utils.xsession import replay
+
+TOKEN = "replayed.jwt.token"
+ROUNDS = 20
+
+
+def make_adapter(login_status: int = 200) -> replay.ReplayAdapter:
+    adapter = replay.ReplayAdapter(latency=0.005)
+    adapter.add(replay.url_to_pattern(kkwcy_com.Signer.url_login), {"token": TOKEN}, status=login_status, method="POST")
+    adapter.add(replay.url_to_pattern(kkwcy_com.Signer.url_signin), {"credit": 10}, method="POST")
+    adapter.add(replay.url_to_pattern(kkwcy_com.Signer.url_logout), {}, method="GET")
+    return adapter
+
+
+def check_signin() -> None:
+    adapter = make_adapter()
+    replay.install(adapter)
+    signer = kkwcy_com.Signer("usrn", "pwd")
+    assert signer.signin() is True, "signin should succeed"
+    assert signer.s.headers["Authorization"] == "Bearer " + TOKEN, "token of login should be used"
+    stats = adapter.stats()
+    assert stats["hits"] == 3 and stats["misses"] == 0, stats
+
+
+def check_login_failed() -> None:
+    adapter = make_adapter(login_status=403)
+    replay.install(adapter)
+    signer = kkwcy_com.Signer("usrn", "pwd")
+    assert signer.signin() is False, "signin should fail if login failed"
+    assert "Authorization" not in signer.s.headers
+    stats = adapter.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 0, stats  # no signin or logout after a failed login
+
+
+def bench_signin() -> float:
+    adapter = make_adapter()
+    replay.install(adapter)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        kkwcy_com.Signer("usrn", "pwd").signin()
+    return (time.perf_counter() - start) / ROUNDS
+
+
+if __name__ == "__main__":
+    try:
+        check_signin()
+        check_login_failed()
+        print(f"kkwcy.com signin: {bench_signin():.6f} s/round")
+    finally:
+        replay.install(None)
+
+    print("All checks passed!")
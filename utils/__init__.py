@@ -1,6 +1,7 @@
 # -*- coding: UTF-8 -*-
 
 from . import (
+    logsetup,
     nocaptcha,
     media,
     secrets,
@@ -24,8 +24,9 @@ class Downloader:
 
     def __init__(self) -> None:
         self.logger = logging.getLogger(__name__)
-        self.s = xsession.KuwoMusic()
-        self.s.headers.update(self.headers)
+        self.s = xsession.get_session("kuwomusic", headers=self.headers)
+        if not self.s.concurrency_limiter:
+            self.s.enable_concurrency_limit(initial=2, max_limit=8)
 
     def _get_lyric(self, song_id) -> List[Tuple[str, str]]:
         """
@@ -72,12 +73,9 @@ class Downloader:
                 "{} - {}.mp3".format(song_info["artist"] or "unknown", song_name)
             )
             if not save_path.is_file():
-                song_data = self.s.get_song_data(song_id)
-                if not song_data:
+                if not self.s.download_song(song_id, save_path):
                     self.logger.error("Failed to get song data:{}".format(song_id))
                     return False
-                else:
-                    save_path.write_bytes(song_data)
 
         if metadata:
             song_eyed3 = eyed3.load(save_path.as_posix(), tag_version=eyed3.id3.ID3_V2)
@@ -107,6 +105,15 @@ class Downloader:
 
         return True
 
+    def _download_songs(self, song_ids: list, output_dir: Union[str, Path], metadata: bool, lyric: bool, desc: str) -> int:
+        """Download songs in parallel under concurrency limit of session, return success count."""
+        with tqdm(total=len(song_ids), desc=desc) as bar:
+            def _download(id_) -> bool:
+                ok = self.download_song(id_, output_dir, metadata, lyric)
+                bar.update()
+                return ok
+            return sum(self.s.concurrency_limiter.map(_download, song_ids))
+
     def download_artist(self, artist_id, output_dir: Union[str, Path], metadata: bool = True, lyric: bool = True, num: int = 9999) -> int:
         song_ids = []
         cur_p = 1
@@ -117,12 +124,7 @@ class Downloader:
             song_ids.extend(e["rid"] for e in artist_music["list"])
             cur_p += 1
 
-        success_count = 0
-        for id_ in tqdm(song_ids[:num], "Artist:{}".format(artist_id)):
-            if self.download_song(id_, output_dir, metadata, lyric):
-                success_count += 1
-
-        return success_count
+        return self._download_songs(song_ids[:num], output_dir, metadata, lyric, "Artist:{}".format(artist_id))
 
     def download_album(self, album_id, output_dir: Union[str, Path], metadata: bool = True, lyric: bool = True, num: int = 9999) -> int:
         song_ids = []
@@ -134,12 +136,7 @@ class Downloader:
             song_ids.extend(e["rid"] for e in album_info["musicList"])
             cur_p += 1
 
-        success_count = 0
-        for id_ in tqdm(song_ids[:num], "Album:{}".format(album_id)):
-            if self.download_song(id_, output_dir, metadata, lyric):
-                success_count += 1
-
-        return success_count
+        return self._download_songs(song_ids[:num], output_dir, metadata, lyric, "Album:{}".format(album_id))
 
     def download_playlist(self, playlist_id, output_dir: Union[str, Path], metadata: bool = True, lyric: bool = True, num: int = 9999) -> int:
         song_ids = []
@@ -151,12 +148,7 @@ class Downloader:
             song_ids.extend(e["rid"] for e in playlist_info["musicList"])
             cur_p += 1
 
-        success_count = 0
-        for id_ in tqdm(song_ids[:num], "Playlist:{}".format(playlist_id)):
-            if self.download_song(id_, output_dir, metadata, lyric):
-                success_count += 1
-
-        return success_count
+        return self._download_songs(song_ids[:num], output_dir, metadata, lyric, "Playlist:{}".format(playlist_id))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+# -*- coding: UTF-8 -*-
+
+"""Logging setup shared by entry points.
+
+Records are put into a queue by the calling thread and written by a background thread,
+after signed urls are redacted, long messages truncated, and repeated warnings rate limited.
+"""
+
+import logging
+import logging.handlers
+import queue
+import re
+import time
+from threading import Lock
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+# query keys whose values are secrets, compared in lower case
+SENSITIVE_KEYS = frozenset([
+    "token", "access_token", "refresh_token", "security-token", "x-oss-security-token",
+    "signature", "x-oss-signature", "ossaccesskeyid", "x-oss-credential", "auth_key", "sign", "csrf", "password",
+])
+
+_URL_QUERY = re.compile(r"(https?://[^\s?#\"'<>]+)\?([^\s#:\"'<>]*)")  # ":" separates url from status in logs
+
+
+class RedactFilter(logging.Filter):
+    """Redact secrets in query strings of urls and truncate long values and messages."""
+
+    def __init__(self, max_length: int = 1000, max_value_length: int = 32) -> None:
+        """
+        Args:
+            max_length (int): Max chars of a message.
+            max_value_length (int): Max chars of a query value.
+        """
+        super().__init__()
+        self.max_length = max_length
+        self.max_value_length = max_value_length
+
+    def _redact_query(self, match: re.Match) -> str:
+        params = []
+        for key, value in parse_qsl(match.group(2), keep_blank_values=True):
+            if key.lower() in SENSITIVE_KEYS or key.lower().startswith("x-oss-"):
+                value = "***"
+            elif len(value) > self.max_value_length:
+                value = value[:self.max_value_length] + "..."
+            params.append((key, value))
+        return "{}?{}".format(match.group(1), urlencode(params, safe="*./:"))
+
+    def redact(self, message: str) -> str:
+        message = _URL_QUERY.sub(self._redact_query, message)
+        if len(message) > self.max_length:
+            message = "{}...({} chars truncated)".format(message[:self.max_length], len(message) - self.max_length)
+        return message
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        redacted = self.redact(message)
+        if redacted != message:
+            record.msg, record.args = redacted, None
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop identical warnings (or above) after `burst` times in `window` seconds.
+
+    The first record after suppression tells how many were dropped.
+    """
+
+    def __init__(self, burst: int = 3, window: float = 60, level: int = logging.WARNING) -> None:
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.level = level
+        self._lock = Lock()
+        self._seen: Dict[Tuple[str, int, str], List[float]] = {}  # key -> [window start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            if len(self._seen) > 10000:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+
+            seen = self._seen.get(key)
+            if seen is None or now - seen[0] >= self.window:
+                suppressed = seen[2] if seen else 0
+                self._seen[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg, record.args = "{} ({} identical messages suppressed)".format(record.getMessage(), int(suppressed)), None
+                return True
+
+            seen[1] += 1
+            if seen[1] <= self.burst:
+                return True
+            seen[2] += 1
+            return False
+
+
+def setup_logging(handlers: List[logging.Handler], level: int = logging.WARNING) -> logging.handlers.QueueListener:
+    """Log through a queue to handlers in a background thread.
+
+    Args:
+        handlers (List[logging.Handler]): Handlers doing actual output, formatter is set if not.
+        level (int): Level of root logger.
+
+    Returns:
+        QueueListener: Started listener, call `stop` before `logging.shutdown` to flush queued records.
+    """
+    fmter = logging.Formatter("{asctime} - {levelname} - {filename} - {lineno} - {message}", "%Y-%m-%d %H:%M:%S", "{")
+    fmter.converter = time.gmtime
+    for hdler in handlers:
+        if hdler.formatter is None:
+            hdler.setFormatter(fmter)
+
+    log_queue = queue.Queue(-1)
+    queue_hdler = logging.handlers.QueueHandler(log_queue)
+    queue_hdler.addFilter(RedactFilter())
+    queue_hdler.addFilter(RateLimitFilter())
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(queue_hdler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def rotating_file_handler(path: str) -> logging.Handler:
+    """1 MB rotating log file with 2 backups."""
+    return logging.handlers.RotatingFileHandler(path, maxBytes=2**20, backupCount=2, encoding="utf8")
@@ -3,3 +3,6 @@ from .pixiv import Pixiv
 from .bilibili import Bilibili
 # from .kuwomusic import KuwoMusic
 from .aliyundrive import AliyunDrive
+from .registry import get_session
+from .pool import SessionPool
+from .aio import AsyncXSession, AsyncPixivBase, AsyncBilibiliBase, AsyncAliyunDriveBase
@@ -0,0 +1,124 @@
+# -*- coding: UTF-8 -*-
+
+"""Asyncio front-end of sessions.
+
+Requests are sent by the wrapped blocking session in a thread pool,
+so semantics (empty `Response` on error, logging, rate limiting, timeouts and retries) are the same as `XSession`.
+
+Example:
+    async with AsyncPixivBase(xsession.get_session("pixiv")) as s:
+        illusts = await asyncio.gather(*[s._get_illust(id_) for id_ in illust_ids])
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Any, Callable, Type
+
+import requests
+
+from .aliyundrive import AliyunDriveBase
+from .base import XSession
+from .bilibili import BilibiliBase
+from .pixiv import PixivBase
+
+
+def _make_twin(name: str, func: Callable) -> Callable:
+    @wraps(func)
+    async def twin(self: "AsyncXSession", *args, **kwargs):
+        return await self.run(getattr(self.session, name), *args, **kwargs)
+    return twin
+
+
+class AsyncXSession:
+    """Awaitable wrapper of a `XSession`.
+
+    Subclasses set `SESSION_CLASS`, and get async twins of all its `_get_*` and `_post_*` wrappers.
+    Other attributes are read from the wrapped session.
+    """
+
+    SESSION_CLASS: Type[XSession] = XSession
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        for name in dir(cls.SESSION_CLASS):
+            # skip helpers of XSession itself, e.g. _get_host
+            if not name.startswith(("_get_", "_post_")) or hasattr(XSession, name) or name in cls.__dict__:
+                continue
+            func = getattr(cls.SESSION_CLASS, name)
+            if callable(func):
+                setattr(cls, name, _make_twin(name, func))
+
+    def __init__(self, session: XSession = None, max_workers: int = 16) -> None:
+        """
+        Args:
+            session (XSession): Session to wrap, should be an instance of `SESSION_CLASS`, None means create a new one.
+            max_workers (int): Max requests in flight at the same time.
+        """
+        if session is None:
+            session = self.SESSION_CLASS()
+        elif not isinstance(session, self.SESSION_CLASS):
+            raise TypeError("Session should be an instance of {}.".format(self.SESSION_CLASS.__name__))
+
+        self.session = session
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="xsession-async")
+
+        # keep a connection for each worker
+        connections, maxsize, block = session._pool_configs[""]
+        if maxsize < max_workers:
+            session.set_pool("", connections, max_workers, block)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "session":
+            raise AttributeError(name)
+        return getattr(self.session, name)
+
+    async def __aenter__(self) -> "AsyncXSession":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.close()
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call in thread pool of this session, with context (e.g. deadline) of current task."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, partial(context.run, func, *args, **kwargs))
+
+    async def request(self, method, url, *args, **kwargs) -> requests.Response:
+        return await self.run(self.session.request, method, url, *args, **kwargs)
+
+    async def get(self, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("allow_redirects", True)
+        return await self.request("GET", url, **kwargs)
+
+    async def head(self, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("allow_redirects", False)
+        return await self.request("HEAD", url, **kwargs)
+
+    async def post(self, url, data=None, json=None, **kwargs) -> requests.Response:
+        return await self.request("POST", url, data=data, json=json, **kwargs)
+
+    async def put(self, url, data=None, **kwargs) -> requests.Response:
+        return await self.request("PUT", url, data=data, **kwargs)
+
+    async def delete(self, url, **kwargs) -> requests.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    def close(self) -> None:
+        """Shutdown thread pool, the wrapped session is NOT closed since it may be shared."""
+        self._executor.shutdown(wait=False)
+
+
+class AsyncPixivBase(AsyncXSession):
+    SESSION_CLASS = PixivBase
+
+
+class AsyncAliyunDriveBase(AsyncXSession):
+    SESSION_CLASS = AliyunDriveBase
+
+
+class AsyncBilibiliBase(AsyncXSession):
+    SESSION_CLASS = BilibiliBase
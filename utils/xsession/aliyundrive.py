@@ -1,12 +1,13 @@
 # -*- coding: UTF-8 -*-
 
+import contextvars
 import hashlib
-from base64 import b64decode, b64encode
+from base64 import b64decode
 import json
 from math import ceil
 from os import PathLike
 from pathlib import Path
-from typing import Callable, Generator, Iterator, Tuple
+from typing import Callable, Dict, Generator, Iterable, Iterator, List, Optional, Set, Tuple
 from Crypto.Cipher import PKCS1_v1_5
 from Crypto.PublicKey import RSA
 
@@ -14,9 +15,16 @@ from bs4 import BeautifulSoup
 import requests
 
 from .base import XSession, false_retry
+from .digest import digest_file, get_proof_code
+from .pathcache import PathCache, split_path
+from .timeout import is_expired, remaining_time
 from datetime import datetime, timezone
+from functools import partial
 from dateutil.parser import isoparse
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
 
 
 class AliyunDriveBase(XSession):
@@ -45,6 +53,8 @@ class AliyunDriveBase(XSession):
     URL_v2_file_get = "https://api.aliyundrive.com/v2/file/get"
     URL_v2_file_move = "https://api.aliyundrive.com/v2/file/move"
     URL_v2_file_complete = "https://api.aliyundrive.com/v2/file/complete"
+    URL_v2_file_get_upload_url = "https://api.aliyundrive.com/v2/file/get_upload_url"
+    URL_v2_file_list_uploaded_parts = "https://api.aliyundrive.com/v2/file/list_uploaded_parts"
     URL_v2_get_file_download_url = "https://api.aliyundrive.com/v2/file/get_download_url"
     URL_v2_recyclebin_trash = "https://api.aliyundrive.com/v2/recyclebin/trash"  # 204
     URL_v2_recyclebin_restore = "https://api.aliyundrive.com/v2/recyclebin/restore"  # 204
@@ -61,6 +71,14 @@ class AliyunDriveBase(XSession):
         super().__init__()
         self.headers["Referer"] = AliyunDriveBase.URL_www
 
+        # api calls and oss upload/download hosts have their own budgets
+        self.set_rate_limit("api.aliyundrive.com", 10, 20)
+        self.set_rate_limit("*.aliyundrive.net", 5, 10)
+        self.set_pool("api.aliyundrive.com", maxsize=20)
+
+        # oss part uploads of 10 MB need longer read timeout than api calls
+        self.enable_adaptive_timeout()
+
     def _check_response(self, res: requests.Response) -> dict:
         """Check a json response."""
 
@@ -70,7 +88,7 @@ class AliyunDriveBase(XSession):
 
         # check valid json data
         try:
-            json_ = res.json()
+            json_ = self._load_json(res)
         except ValueError:
             self.logger.error("{}:JsonValueError.".format(res.url))
             return {}
@@ -138,7 +156,7 @@ class AliyunDriveBase(XSession):
 
         if res.status_code != 200:
             return {}
-        return res.json()
+        return self._load_json(res)
 
     def _get_passport_mini_login(
         self,
@@ -267,7 +285,7 @@ class AliyunDriveBase(XSession):
         # print(res.text)
 
         try:
-            json_ = res.json()
+            json_ = self._load_json(res)
         except ValueError:
             self.logger.error("JsonDeodeError.")
             return {}
@@ -359,7 +377,8 @@ class AliyunDriveBase(XSession):
         drive_id: str, name: str,
         parent_file_id: str = "root", type_: str = "file", check_name_mode: str = "refuse", *,
         part_info_list: list = None,
-        size: int = 0, content_hash_name: str = "sha1", content_hash: str = "", proof_version: str = "v1", proof_code: str = ""
+        size: int = 0, content_hash_name: str = "sha1", content_hash: str = "", proof_version: str = "v1", proof_code: str = "",
+        pre_hash: str = ""
     ) -> dict:
         """Create file or folder tree.
 
@@ -377,9 +396,11 @@ class AliyunDriveBase(XSession):
             cotent_hash (str): Hash value of file.
             proof_version (str): Version of arg `proof_code`.
             proof_code (str): Used to proof you really own this file.
+            pre_hash (str): Sha1 of first 1 KB of file, used instead of `content_hash` to check if rapid upload may match.
 
         Returns:
-            See responses/aliyundrive/adrive_v2_file_createWithFolders.json
+            See responses/aliyundrive/adrive_v2_file_createWithFolders.json,
+            or {"code": "PreHashMatched", ...} if `pre_hash` matched and file should be created again with `content_hash`.
         """
 
         json_data = {
@@ -403,12 +424,27 @@ class AliyunDriveBase(XSession):
                     "proof_version": proof_version,
                     "proof_code": proof_code
                 })
+            elif pre_hash:
+                json_data.update({
+                    "size": size,
+                    "pre_hash": pre_hash
+                })
 
         res = self.post(
             AliyunDriveBase.URL_adrive_v2_file_createwithfolders,
-            json=json_data
+            json=json_data,
+            expected_status=(409,) if pre_hash else ()
         )
 
+        # server has files of the same first 1 KB
+        if pre_hash and res.status_code == 409:
+            try:
+                json_ = self._load_json(res)
+            except ValueError:
+                json_ = {}
+            if json_.get("code") == "PreHashMatched":
+                return json_
+
         return self._check_response(res)
 
     @false_retry()
@@ -435,6 +471,56 @@ class AliyunDriveBase(XSession):
 
         return self._check_response(res)
 
+    @false_retry()
+    def _post_file_get_upload_url(self, drive_id: str, file_id: str, upload_id: str, part_info_list: list) -> dict:
+        """Get new upload urls of parts of an unfinished upload.
+
+        Args:
+            part_info_list (list): Part numbers, e.g. [{"part_number": 2}, ...].
+
+        Returns:
+            {"file_id": str, "upload_id": str, "part_info_list": [{"part_number": int, "upload_url": str, ...}, ...], ...}
+        """
+
+        res = self.post(
+            AliyunDriveBase.URL_v2_file_get_upload_url,
+            json={
+                "drive_id": drive_id,
+                "file_id": file_id,
+                "upload_id": upload_id,
+                "part_info_list": part_info_list
+            }
+        )
+
+        return self._check_response(res)
+
+    @false_retry()
+    def _post_file_list_uploaded_parts(self, drive_id: str, file_id: str, upload_id: str, part_number_marker: str = "") -> dict:
+        """List parts already uploaded of an unfinished upload.
+
+        Args:
+            part_number_marker (str): Get from "next_part_number_marker" of last return, empty for first page.
+
+        Returns:
+            {"file_id": str, "upload_id": str, "parallel_upload": bool,
+            "uploaded_parts": [{"part_number": int, "part_size": int, "etag": str, ...}, ...], "next_part_number_marker": str}
+        """
+
+        json_data = {
+            "drive_id": drive_id,
+            "file_id": file_id,
+            "upload_id": upload_id
+        }
+        if part_number_marker:
+            json_data["part_number_marker"] = part_number_marker
+
+        res = self.post(
+            AliyunDriveBase.URL_v2_file_list_uploaded_parts,
+            json=json_data
+        )
+
+        return self._check_response(res)
+
     def _post_file_search(
         self,
         drive_id: str,
@@ -563,6 +649,31 @@ class AliyunDriveBase(XSession):
         )
         return self._check_response(res)
 
+    @false_retry()
+    def _post_batch_get_download_url(self, drive_id: str, file_ids: Iterable[str]) -> dict:
+        """Get download urls of many files in one call.
+
+        Returns:
+            {"responses": [{"id": "<file_id>", "status": int, "body": see `_post_file_get_download_url`}]}
+        """
+        res = self.post(
+            AliyunDriveBase.URL_v3_batch,
+            json={
+                "requests": [
+                    {
+                        "body": {"drive_id": drive_id, "file_id": file_id},
+                        "headers": {"Content-Type": "application/json"},
+                        "id": file_id,
+                        "method": "POST",
+                        "url": "/file/get_download_url"
+                    }
+                    for file_id in file_ids
+                ],
+                "resource": "file"
+            }
+        )
+        return self._check_response(res)
+
     def _post_recyclebin_trash(self, drive_id: str, file_id: str) -> bool:
         """Status Code: 204 (No Content)"""
         res = self.post(
@@ -674,8 +785,23 @@ class AliyunDrive(AliyunDriveBase):
         cipher = encrypter.encrypt(plain.encode("utf8")).hex()
         return cipher
 
+    # multipart upload, part size is chosen so a part takes about PART_SECONDS at measured throughput
+    PART_SIZE_DEFAULT = 10*1024*1024
+    PART_SIZE_MIN = 4*1024*1024
+    PART_SIZE_MAX = 64*1024*1024
+    PART_SECONDS = 10
+    MAX_PARTS = 10000
+
+    # files of at least PRE_HASH_MIN_SIZE are fully hashed for rapid upload only if sha1 of first PRE_HASH_SIZE bytes matched
+    PRE_HASH_SIZE = 1024
+    PRE_HASH_MIN_SIZE = 10*1024*1024
+
+    # tokens and their headers are synced between sessions of a pool
+    SHARED_ATTRS = ("user_id", "drive_id", "token_type", "access_token", "refresh_token", "device_id", "expire_time")
+
     def __init__(self) -> None:
         super().__init__()
+        self._refresh_lock = threading.RLock()  # shared by sessions cloned in a pool
         self.user_id = ""
         self.drive_id = ""
 
@@ -686,6 +812,17 @@ class AliyunDrive(AliyunDriveBase):
 
         self.expire_time = datetime.now(timezone.utc).replace(2020)  # access token expire time
 
+        self._download_urls: Dict[str, dict] = {}  # file id -> download url info, until it expires
+        self._download_urls_lock = threading.Lock()
+
+        self.upload_concurrency = 3  # parts uploaded at the same time, 1 means sequential
+        self._parts_sequential = False  # set once server refused parts out of order
+        self._upload_throughput = None  # moving average bytes per second of a part upload
+        self._upload_throughput_lock = threading.Lock()
+        self.upload_state_dir = Path("tmp", "aliyundrive_uploads")  # progress of unfinished uploads, None to disable resume
+        self._upload_state_lock = threading.RLock()
+        self.path_cache = PathCache()  # drive path -> file id, None to list folders every time
+
     @property
     def client_id(self) -> str:
         """Get from client id from sign in html page.
@@ -809,11 +946,7 @@ class AliyunDrive(AliyunDriveBase):
         if not self._check_refresh():
             return ""
         if version == "v1":
-            md5_token = hashlib.md5(self.access_token.encode("utf8")).hexdigest()
-            start = int(md5_token[0:16], 16) % file_size
-            with filepath.open("rb") as f:
-                f.seek(start)
-                proof_code = b64encode(f.read(8)).decode("utf8")
+            proof_code = get_proof_code(filepath, self.access_token)
         else:
             raise ValueError("version must be v1")
 
@@ -827,26 +960,43 @@ class AliyunDrive(AliyunDriveBase):
         """
 
         # if expire in 5 min
-        if (self.expire_time - datetime.now(timezone.utc)).total_seconds() <= 60:
-            self.logger.warning("Token is about to expire, try to auto refresh.")
+        if self._is_expiring():
+            with self._refresh_lock:
+                # token may have been refreshed by another session of pool
+                if self.session_pool:
+                    self.session_pool.sync(self)
+                if self._is_expiring() and not self._refresh():
+                    return False
 
-            # try refresh token
-            refresh_info = self._post_token_refresh(self.refresh_token)
-            if not refresh_info:
-                self.logger.error("Refresh token failed.")
-                return False
+        return True
+
+    def _is_expiring(self) -> bool:
+        return (self.expire_time - datetime.now(timezone.utc)).total_seconds() <= 60
 
-            # update info
-            self.user_id = refresh_info["user_id"]
-            self.drive_id = refresh_info["default_drive_id"]
+    def _refresh(self) -> bool:
+        """Refresh token and update info."""
 
-            self.token_type = refresh_info["token_type"]
-            self.access_token = refresh_info["access_token"]
-            self.refresh_token = refresh_info["refresh_token"]
-            self.device_id = refresh_info["device_id"]
+        self.logger.warning("Token is about to expire, try to auto refresh.")
 
-            self.expire_time = isoparse(refresh_info["expire_time"])  # include timezone, utc time
+        # try refresh token
+        refresh_info = self._post_token_refresh(self.refresh_token)
+        if not refresh_info:
+            self.logger.error("Refresh token failed.")
+            return False
+
+        # update info
+        self.user_id = refresh_info["user_id"]
+        self.drive_id = refresh_info["default_drive_id"]
+
+        self.token_type = refresh_info["token_type"]
+        self.access_token = refresh_info["access_token"]
+        self.refresh_token = refresh_info["refresh_token"]
+        self.device_id = refresh_info["device_id"]
+
+        self.expire_time = isoparse(refresh_info["expire_time"])  # include timezone, utc time
 
+        if self.session_pool:
+            self.session_pool.publish(self)
         return True
 
     def _get_file_id(self, path: PathLike) -> str:
@@ -859,11 +1009,11 @@ class AliyunDrive(AliyunDriveBase):
         Returns:
             Empty string if not found, "root" for empty string path.
         """
-        path_parts = Path(path).parts
+        path_parts = split_path(path)
 
-        # use list to find file id
-        current_id = "root"
-        for part in path_parts:
+        # start from deepest folder known, list from there, listed items are cached by glob_file
+        current_id, depth = self.path_cache.lookup(path_parts) if self.path_cache else ("root", 0)
+        for part in path_parts[depth:]:
             # find children id
             for item in self.glob_file(current_id):
                 if item["name"] == part:
@@ -874,6 +1024,26 @@ class AliyunDrive(AliyunDriveBase):
 
         return current_id
 
+    def enable_path_cache(self, path: PathLike = None, ttl: float = 24*3600) -> PathCache:
+        """Replace path cache, e.g. with one persisted between runs.
+
+        Args:
+            path (PathLike): Json file entries are loaded from, call `path_cache.save()` to write it.
+            ttl (float): Seconds an entry is trusted.
+        """
+        self.path_cache = PathCache(path, ttl)
+        return self.path_cache
+
+    def _cache_created(self, parent_file_id: str, path: PathLike, info: dict) -> None:
+        """Cache path of a created file or folder and its parent folder."""
+        if not self.path_cache or not info.get("file_id"):
+            return
+        names = split_path(path)
+        if len(names) > 1 and info.get("parent_file_id"):
+            self.path_cache.put(parent_file_id, names[:-1], info["parent_file_id"])
+        name = info.get("file_name") or info.get("name") or names[-1]  # may be renamed by "auto_rename"
+        self.path_cache.put(parent_file_id, names[:-1] + (name,), info["file_id"])
+
     def login(self, usrn: str, pwd: str, *, refresh_token: str = "", cookies: dict = None) -> bool:
         """Login.
 
@@ -969,44 +1139,230 @@ class AliyunDrive(AliyunDriveBase):
         if check_name_mode == "refuse" and create_info.get("exist") is True:
             self.logger.info("Folder {} already exist.".format(folder_path.as_posix()))
 
+        self._cache_created(parent_file_id, folder_path, create_info)
         self.logger.info("Successfully create folder {}.".format(folder_path.as_posix()))
         return create_info
 
-    def upload_file(
-        self,
-        file_upload_path: PathLike, file_local_path: PathLike,
-        parent_file_id: str = "root",
-        *,
-        parent_file_drive_path: PathLike = "",
-        check_name_mode: str = "refuse", try_rapid_upload: bool = True
-    ) -> dict:
-        """Upload a file to specified path.
+    def _get_part_size(self, file_size: int) -> int:
+        """Part size for a file, from measured throughput of a part upload, in whole MB."""
+        part_size = self.PART_SIZE_DEFAULT
+        if self._upload_throughput:
+            part_size = int(self._upload_throughput * self.PART_SECONDS)
+        part_size = min(self.PART_SIZE_MAX, max(self.PART_SIZE_MIN, part_size, ceil(file_size / self.MAX_PARTS)))
+        return ceil(part_size / (1024*1024)) * 1024*1024
+
+    def _observe_upload(self, size: int, elapsed: float) -> None:
+        if size < self.PART_SIZE_MIN or elapsed <= 0:
+            return
+        with self._upload_throughput_lock:
+            throughput = size / elapsed
+            if self._upload_throughput is None:
+                self._upload_throughput = throughput
+            else:
+                self._upload_throughput += 0.3 * (throughput - self._upload_throughput)
 
-        Args:
-            file_upload_path (PathLike): The full path of file to upload, include full filename and suffix.
-            file_local_path (PathLike): The local path of file to upload.
-            parent_file_id (str): The parent node of node to be operated. Can be "root" or a string of node id.
-            check_name_mode (str): ["auto_rename" | "refuse" | "overwrite"].
-            try_rapid_upload (bool): If try rapid upload, will take time to calc sha1 and proof code.
+    def _put_part(self, upload_url: str, chunk: bytes) -> str:
+        """Upload a part, try 3 times.
 
         Returns:
-            Return empty if failed,
-            else see responses/aliyundrive/adrive_v2_file_createWithFolders.json
-                and responses/aliyundrive/v2_file_complete.json
+            str: ["ok" | "not_sequential" | "failed"]
         """
+        for i in range(3):
+            if i > 0:
+                backoff = self.retry_policy.get_backoff(i - 1, self.pop_retry_after())
+                remaining = remaining_time()
+                if remaining is not None and backoff >= remaining:
+                    break
+                sleep(backoff)
+
+            start = perf_counter()
+            res = self.put(upload_url, data=chunk)
+            if res.status_code is None:
+                continue
+            if res.ok:
+                self._observe_upload(len(chunk), perf_counter() - start)
+                return "ok"
+            # uploaded by a previous attempt whose response was lost
+            if res.status_code == 409 and "PartAlreadyExist" in res.text:
+                return "ok"
+            if res.status_code in (400, 409) and "PartNotSequential" in res.text:
+                return "not_sequential"
+        return "failed"
+
+    def _upload_parts_concurrently(self, filepath: Path, part_info_list: List[dict], part_size: int, on_uploaded: Callable[[int], None] = None) -> List[dict]:
+        """Upload parts by `upload_concurrency` threads, `on_uploaded` is called with number of each uploaded part.
 
-        if not parent_file_id:
-            parent_file_id = self._get_file_id(parent_file_drive_path)
+        Returns:
+            List[dict]: Parts not uploaded, if server requires parts in order, the rest are not tried.
+        """
+        stop = threading.Event()
 
-        PART_SIZE = 10*1024*1024  # divide single file to parts
+        def _upload(part_info: dict) -> bool:
+            if stop.is_set() or is_expired():
+                return False
+            with filepath.open("rb") as f:
+                f.seek((part_info["part_number"] - 1) * part_size)
+                chunk = f.read(part_size)
+            result = self._put_part(part_info["upload_url"], chunk)
+            if result == "not_sequential":
+                self._parts_sequential = True
+                stop.set()
+            if result == "ok" and on_uploaded:
+                on_uploaded(part_info["part_number"])
+            return result == "ok"
+
+        with ThreadPoolExecutor(self.upload_concurrency, thread_name_prefix="adrive-upload") as executor:
+            # each part runs in a copy of current context to keep deadline
+            futures = [executor.submit(contextvars.copy_context().run, _upload, part_info) for part_info in part_info_list]
+            uploaded = [future.result() for future in futures]
+        return [part_info for part_info, ok in zip(part_info_list, uploaded) if not ok]
+
+    def _upload_parts_sequentially(self, filepath: Path, part_info_list: List[dict], part_size: int, on_uploaded: Callable[[int], None] = None) -> bool:
+        """Upload parts in order, next part is read while current part is in flight."""
+
+        def _read(part_info: dict) -> bytes:
+            with filepath.open("rb") as f:
+                f.seek((part_info["part_number"] - 1) * part_size)
+                return f.read(part_size)
+
+        with ThreadPoolExecutor(1, thread_name_prefix="adrive-read") as reader:
+            next_chunk = reader.submit(_read, part_info_list[0]) if part_info_list else None
+            for i, part_info in enumerate(part_info_list):
+                # stop before a part which can not be finished
+                if is_expired():
+                    self.logger.error("Deadline reached, file {} upload stopped at part {}.".format(filepath.as_posix(), part_info["part_number"]))
+                    return False
+
+                chunk = next_chunk.result()
+                if i + 1 < len(part_info_list):
+                    next_chunk = reader.submit(_read, part_info_list[i + 1])
+                if self._put_part(part_info["upload_url"], chunk) != "ok":
+                    self.logger.error("File {} Part {} upload failed.".format(filepath.as_posix(), part_info["part_number"]))
+                    return False
+                if on_uploaded:
+                    on_uploaded(part_info["part_number"])
+        return True
 
-        filepath = Path(file_local_path)
+    def _upload_parts(self, filepath: Path, part_info_list: List[dict], part_size: int, on_uploaded: Callable[[int], None] = None) -> bool:
+        """Upload parts concurrently if server allows, otherwise in order."""
+        if not self._parts_sequential and self.upload_concurrency > 1 and len(part_info_list) > 1:
+            part_info_list = self._upload_parts_concurrently(filepath, part_info_list, part_size, on_uploaded)
+            if not part_info_list:
+                return True
+            if not self._parts_sequential:
+                self.logger.error("File {} {} parts upload failed.".format(filepath.as_posix(), len(part_info_list)))
+                return False
+            self.logger.info("Parts must be uploaded in order, continue file {} from part {}.".format(filepath.as_posix(), part_info_list[0]["part_number"]))
+        return self._upload_parts_sequentially(filepath, part_info_list, part_size, on_uploaded)
+
+    def _get_upload_state_path(self, file_upload_path: PathLike, parent_file_id: str) -> Path:
+        """State file of an upload, named by hash of drive, parent and upload path."""
+        key = json.dumps([self.drive_id, parent_file_id, Path(file_upload_path).as_posix()])
+        return Path(self.upload_state_dir, hashlib.sha1(key.encode("utf8")).hexdigest() + ".json")
+
+    @staticmethod
+    def _get_sample_hash(filepath: Path, sample_size: int = 64*1024) -> str:
+        """Sha1 of size and bytes at start, middle and end of file.
+
+        Local files may be downloaded again by a later run, so mtime and inode can not tell if content changed.
+        """
+        size = filepath.stat().st_size
+        sha1 = hashlib.sha1(str(size).encode("utf8"))
+        with filepath.open("rb") as f:
+            for offset in (0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)):
+                f.seek(offset)
+                sha1.update(f.read(sample_size))
+        return sha1.hexdigest()
+
+    def _load_upload_state(self, state_path: Path, filepath: Path) -> dict:
+        """Load state of an unfinished upload, empty if not found or local file has changed since."""
+        try:
+            state = json.loads(state_path.read_text("utf8"))
+        except (OSError, ValueError):
+            return {}
+        if state.get("sample_hash") != self._get_sample_hash(filepath):
+            self.logger.info("File {} changed since last upload, upload from start.".format(filepath.as_posix()))
+            return {}
+        return state
+
+    def _save_upload_state(self, state_path: Path, state: dict) -> None:
+        """Write state to a temp file and replace, so a killed process never leaves a broken state."""
+        with self._upload_state_lock:
+            try:
+                state_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = state_path.with_suffix(".tmp")
+                tmp_path.write_text(json.dumps(state), "utf8")
+                tmp_path.replace(state_path)
+            except OSError as e:
+                self.logger.warning("{}:Failed to save upload state, {}.".format(state_path.as_posix(), e))
+
+    def _record_uploaded_part(self, state_path: Path, state: dict, part_number: int) -> None:
+        with self._upload_state_lock:
+            state["uploaded_parts"].append(part_number)
+            self._save_upload_state(state_path, state)
+
+    def _get_uploaded_part_numbers(self, file_id: str, upload_id: str) -> Optional[Set[int]]:
+        """Numbers of parts server holds, None if failed to list."""
+        uploaded = set()
+        marker = ""
+        while True:
+            if not self._check_refresh():
+                return None
+            parts_info = self._post_file_list_uploaded_parts(self.drive_id, file_id, upload_id, marker)
+            if not parts_info:
+                return None
+            if parts_info.get("parallel_upload") is False:
+                self._parts_sequential = True
+            uploaded.update(part["part_number"] for part in parts_info.get("uploaded_parts") or [])
+            marker = parts_info.get("next_part_number_marker")
+            if not marker:
+                return uploaded
+
+    def _get_resume_part_info_list(self, filepath: Path, state: dict) -> Optional[List[dict]]:
+        """Part info with new upload urls of parts not uploaded yet, None if the upload can not be resumed.
+
+        Parts server holds are skipped, recorded progress is used if server parts can not be listed.
+        """
+        uploaded = self._get_uploaded_part_numbers(state["file_id"], state["upload_id"])
+        if uploaded is None:
+            self.logger.warning("Failed to list uploaded parts of file {}, use recorded progress.".format(filepath.as_posix()))
+            uploaded = set(state["uploaded_parts"])
+
+        missing = [{"part_number": i} for i in range(1, state["parts"] + 1) if i not in uploaded]
+        if not missing:
+            return []
+
+        if not self._check_refresh():
+            return None
+        upload_info = self._post_file_get_upload_url(self.drive_id, state["file_id"], state["upload_id"], missing)
+        if not upload_info.get("part_info_list"):
+            return None
+
+        self.logger.info("Resume upload file {} from part {}, {}/{} parts uploaded.".format(
+            filepath.as_posix(), missing[0]["part_number"], state["parts"] - len(missing), state["parts"]
+        ))
+        return sorted(upload_info["part_info_list"], key=lambda part_info: part_info["part_number"])
+
+    def _create_upload(
+        self,
+        file_upload_path: PathLike, filepath: Path,
+        parent_file_id: str, check_name_mode: str, try_rapid_upload: bool
+    ) -> dict:
+        """Create file with parts of size chosen by throughput, try rapid upload if needed.
+
+        Large files are probed with pre hash first, and fully hashed only if it matched.
+
+        Returns:
+            Return empty if failed,
+            else see responses/aliyundrive/adrive_v2_file_createWithFolders.json, with an extra "part_size".
+        """
 
         # decide whether to split file
         file_size = filepath.stat().st_size
+        part_size = self._get_part_size(file_size)
 
         part_info_list = []
-        for i in range(ceil(file_size / PART_SIZE) or 1):
+        for i in range(ceil(file_size / part_size) or 1):
             # at least one part
             part_info_list.append({"part_number": i + 1})
 
@@ -1014,33 +1370,52 @@ class AliyunDrive(AliyunDriveBase):
         content_hash = ""
         proof_code = ""
 
-        # process rapid upload
-        if try_rapid_upload:
-            # calculate sha1 hash
-            content_hash = hashlib.sha1()
+        # ask server with first 1 KB before reading whole of a large file
+        create_info = {}
+        if try_rapid_upload and file_size >= self.PRE_HASH_MIN_SIZE:
             with filepath.open("rb") as f:
-                while True:
-                    # 10 MB each time
-                    chunk = f.read(10*1024*1024)
-                    if not chunk:
-                        break
-                    content_hash.update(chunk)
-            content_hash = content_hash.hexdigest().upper()
+                pre_hash = hashlib.sha1(f.read(self.PRE_HASH_SIZE)).hexdigest()
+
+            if not self._check_refresh():
+                return {}
+            create_info = self._post_file_create_with_folders(
+                self.drive_id,
+                Path(file_upload_path).as_posix(),
+                parent_file_id, "file", check_name_mode,
+                part_info_list=part_info_list,
+                size=file_size,
+                pre_hash=pre_hash
+            )
+            if not create_info:
+                self.logger.error("Failed to get create info of file {}.".format(filepath.as_posix()))
+                return {}
+            if create_info.get("code") == "PreHashMatched":
+                self.logger.info("Pre hash of file {} matched, try rapid upload.".format(filepath.as_posix()))
+                create_info = {}
+            else:
+                try_rapid_upload = False  # no file on server can match, upload parts of this create
 
-            # caculate proof code
-            proof_code = self._get_proof_code(filepath, "v1")
+        # process rapid upload
+        if try_rapid_upload:
+            # sha1 and proof code in one pass
+            if not self._check_refresh():
+                return {}
+            digest = digest_file(filepath, proof_token=self.access_token)
+            content_hash = digest["sha1"]
+            proof_code = digest["proof_code"]
 
-        if not self._check_refresh():
-            return {}
-        create_info = self._post_file_create_with_folders(
-            self.drive_id,
-            Path(file_upload_path).as_posix(),
-            parent_file_id, "file", check_name_mode,
-            part_info_list=part_info_list,
-            size=file_size,
-            content_hash_name="sha1", content_hash=content_hash,
-            proof_version="v1", proof_code=proof_code
-        )
+        if not create_info:
+            if not self._check_refresh():
+                return {}
+            create_info = self._post_file_create_with_folders(
+                self.drive_id,
+                Path(file_upload_path).as_posix(),
+                parent_file_id, "file", check_name_mode,
+                part_info_list=part_info_list,
+                size=file_size,
+                content_hash_name="sha1", content_hash=content_hash,
+                proof_version="v1", proof_code=proof_code
+            )
 
         if not create_info:
             self.logger.error("Failed to get create info of file {}.".format(filepath.as_posix()))
@@ -1060,34 +1435,95 @@ class AliyunDrive(AliyunDriveBase):
             self.logger.info("Rapid upload file {}".format(filepath.as_posix()))
             return create_info
 
+        create_info["part_size"] = part_size
+        return create_info
+
+    def upload_file(
+        self,
+        file_upload_path: PathLike, file_local_path: PathLike,
+        parent_file_id: str = "root",
+        *,
+        parent_file_drive_path: PathLike = "",
+        check_name_mode: str = "refuse", try_rapid_upload: bool = True
+    ) -> dict:
+        """Upload a file to specified path.
+
+        An upload failed halfway is resumed by a later call with the same paths if local file is unchanged,
+        progress is saved in `upload_state_dir`.
+
+        Args:
+            file_upload_path (PathLike): The full path of file to upload, include full filename and suffix.
+            file_local_path (PathLike): The local path of file to upload.
+            parent_file_id (str): The parent node of node to be operated. Can be "root" or a string of node id.
+            check_name_mode (str): ["auto_rename" | "refuse" | "overwrite"].
+            try_rapid_upload (bool): If try rapid upload, will take time to calc sha1 and proof code.
+
+        Returns:
+            Return empty if failed,
+            else see responses/aliyundrive/adrive_v2_file_createWithFolders.json
+                and responses/aliyundrive/v2_file_complete.json
+        """
+
+        if not parent_file_id:
+            parent_file_id = self._get_file_id(parent_file_drive_path)
+
+        filepath = Path(file_local_path)
+
+        # resume an unfinished upload of a previous run
+        state_path = None
+        state = {}
+        part_info_list = None
+        if self.upload_state_dir:
+            state_path = self._get_upload_state_path(file_upload_path, parent_file_id)
+            state = self._load_upload_state(state_path, filepath)
+            if state:
+                part_info_list = self._get_resume_part_info_list(filepath, state)
+                if part_info_list is None:
+                    self.logger.warning("Failed to resume upload file {}, upload from start.".format(filepath.as_posix()))
+
+        if part_info_list is None:
+            create_info = self._create_upload(file_upload_path, filepath, parent_file_id, check_name_mode, try_rapid_upload)
+            if not create_info or not create_info.get("upload_id") or create_info.get("rapid_upload") is True:
+                if create_info:
+                    self._cache_created(parent_file_id, file_upload_path, create_info)
+                return create_info
+
+            state = {
+                "file_upload_path": Path(file_upload_path).as_posix(),
+                "sample_hash": self._get_sample_hash(filepath),
+                "file_id": create_info["file_id"], "upload_id": create_info["upload_id"],
+                "part_size": create_info["part_size"], "parts": len(create_info["part_info_list"]),
+                "uploaded_parts": []
+            }
+            part_info_list = create_info["part_info_list"]
+
+        # record progress of each part, so a later run can continue from first missing part
+        if state_path:
+            self._save_upload_state(state_path, state)
+        on_uploaded = partial(self._record_uploaded_part, state_path, state) if state_path else None
+
         # upload file chunks
-        with filepath.open("rb") as f:
-            for part_info in create_info["part_info_list"]:
-                upload_url = part_info["upload_url"]
-                chunk = f.read(PART_SIZE)
-
-                # try 3 times
-                flag = False
-                for _ in range(3):
-                    res = self.put(upload_url, data=chunk)
-                    if res.status_code is not None and res.ok:
-                        flag = True
-                        break
-                if not flag:
-                    self.logger.error("File {} Part {} upload failed.".format(filepath.as_posix(), part_info["part_number"]))
-                    return {}
+        uploaded = self._upload_parts(filepath, part_info_list, state["part_size"], on_uploaded)
+        if not uploaded:
+            if state_path:
+                self.logger.info("Progress of file {} saved, upload will be resumed next time.".format(filepath.as_posix()))
+            return {}
 
         if not self._check_refresh():
             return {}
         complete_info = self._post_file_complete(
             self.drive_id,
-            create_info["file_id"],
-            create_info["upload_id"]
+            state["file_id"],
+            state["upload_id"]
         )
         if not complete_info:
             self.logger.error("Failed to complete upload file {}.".format(filepath.as_posix()))
             return {}
 
+        if state_path:
+            state_path.unlink(missing_ok=True)
+
+        self._cache_created(parent_file_id, file_upload_path, complete_info)
         self.logger.info("Successfully upload file {}.".format(filepath.as_posix()))
         return complete_info
 
@@ -1097,7 +1533,8 @@ class AliyunDrive(AliyunDriveBase):
         file_id: str,
         *,
         file_drive_path: str = "",
-        chunk_size: int = 10*1024*1024
+        chunk_size: int = 1024*1024,
+        segments: int = 4
     ) -> bool:
         """Download a file to local storage.
 
@@ -1105,6 +1542,8 @@ class AliyunDrive(AliyunDriveBase):
             file_local_path: where to save file.
             file_id: id of file in drive, if empty string, need provide file_drive_path
             file_drive_path: file path relative to root in drive
+            chunk_size: bytes of each chunk written.
+            segments: max concurrent range requests of a large file.
         """
         file_local_path = Path(file_local_path)
         if file_local_path.is_file() and file_local_path.stat().st_size > 0:
@@ -1116,22 +1555,71 @@ class AliyunDrive(AliyunDriveBase):
                 return ValueError("Need provide valid file_id or file_drive_path, can't be root or empty.")
             file_id = self._get_file_id(file_drive_path)
 
-        if not self._check_refresh():
+        download_url = self._get_download_url(file_id)
+        if not download_url:
+            return False
+
+        if not self.download_segmented(download_url, file_local_path, segments=segments, chunk_size=chunk_size):
+            # url may be expired or revoked
+            with self._download_urls_lock:
+                self._download_urls.pop(file_id, None)
             return False
+        return True
+
+    def _cache_download_url(self, file_id: str, download_url_info: dict) -> None:
+        if not download_url_info.get("url") or not download_url_info.get("expiration"):
+            return
+        with self._download_urls_lock:
+            self._download_urls[file_id] = download_url_info
+
+    def _get_download_url(self, file_id: str) -> str:
+        """Get download url of a file, from cache if it is not about to expire.
+
+        Returns:
+            Empty string if failed.
+        """
+        with self._download_urls_lock:
+            download_url_info = self._download_urls.get(file_id)
+        if download_url_info and (isoparse(download_url_info["expiration"]) - datetime.now(timezone.utc)).total_seconds() > 60:
+            return download_url_info["url"]
+
+        if not self._check_refresh():
+            return ""
         download_url_info = self._post_file_get_download_url(self.drive_id, file_id)
         if not download_url_info:
-            return False
+            return ""
+        self._cache_download_url(file_id, download_url_info)
+        return download_url_info["url"]
 
-        download_url = download_url_info["url"]
-        res = self.get(download_url, stream=True)
-        if not res.ok:
-            return False
+    def prefetch_download_urls(self, file_ids: Iterable[str], batch_size: int = 100) -> int:
+        """Get download urls of many files by batch calls, used by later `download_file` until they expire.
 
-        with file_local_path.open("wb") as f:
-            for chunk in res.iter_content(chunk_size):
-                f.write(chunk)
+        Returns:
+            int: Number of urls got.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        count = 0
+        for i in range(0, len(file_ids), batch_size):
+            if not self._check_refresh():
+                break
+            batch_info = self._post_batch_get_download_url(self.drive_id, file_ids[i:i+batch_size])
+            for response in batch_info.get("responses", []):
+                if response.get("status") == 200 and response.get("body"):
+                    self._cache_download_url(response["id"], response["body"])
+                    count += 1
+        return count
 
-        return True
+    def download_files(self, files: Dict[PathLike, str], *, segments: int = 4) -> int:
+        """Download many files, their download urls are got by batch calls first.
+
+        Args:
+            files (Dict[PathLike, str]): {"<local path>": "<file id>"}.
+
+        Returns:
+            int: Number of files downloaded or already exist.
+        """
+        self.prefetch_download_urls(file_id for path, file_id in files.items() if not Path(path).is_file())
+        return sum(bool(self.download_file(path, file_id, segments=segments)) for path, file_id in files.items())
 
     def search_file(
         self,
@@ -1214,6 +1702,8 @@ class AliyunDrive(AliyunDriveBase):
             buffer = list_info.get("items", [])
             next_marker = list_info.get("next_marker", "")
             for item in buffer:
+                if self.path_cache:
+                    self.path_cache.put(item.get("parent_file_id", file_id), item["name"], item["file_id"])
                 yield item
                 count += 1
                 # limit result size
@@ -1244,6 +1734,8 @@ class AliyunDrive(AliyunDriveBase):
         if not to_parent_file_id:
             to_parent_file_id = self._get_file_id(to_parent_file_drive_path)
 
+        if self.path_cache:
+            self.path_cache.invalidate(file_id)
         return self._post_file_move(
             self.drive_id, file_id,
             self.drive_id, to_parent_file_id,
@@ -1261,6 +1753,8 @@ class AliyunDrive(AliyunDriveBase):
                 return ValueError("Need provide valid file_id or file_drive_path, can't be root or empty.")
             file_id = self._get_file_id(file_drive_path)
 
+        if self.path_cache:
+            self.path_cache.invalidate(file_id)
         return self._post_file_update(self.drive_id, file_id, name, check_name_mode=check_name_mode)
 
     def glob_recyclebin(
@@ -1310,6 +1804,8 @@ class AliyunDrive(AliyunDriveBase):
                 return ValueError("Need provide valid file_id or file_drive_path, can't be root or empty.")
             file_id = self._get_file_id(file_drive_path)
 
+        if self.path_cache:
+            self.path_cache.invalidate(file_id)
         return self._post_recyclebin_trash(self.drive_id, file_id)
 
     def restore_file(self, file_id: str) -> bool:
@@ -1326,6 +1822,8 @@ class AliyunDrive(AliyunDriveBase):
                 return ValueError("Need provide valid file_id or file_drive_path, can't be root or empty.")
             file_id = self._get_file_id(file_drive_path)
 
+        if self.path_cache:
+            self.path_cache.invalidate(file_id)
         return self._post_file_delete(self.drive_id, file_id)
 
     ####################################
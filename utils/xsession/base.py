@@ -1,36 +1,87 @@
 # -*- coding: UTF-8 -*-
 
+import codecs
+import contextvars
+import hashlib
 import logging
-from functools import wraps
-from time import sleep
-from typing import Tuple, Union
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from math import ceil
+from time import monotonic, perf_counter, sleep
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
 
 import requests
 from requests.adapters import HTTPAdapter
 
+from . import dns
+from .codec import JsonCodec, default_codec
+from .concurrency import ConcurrencyLimiter
+from .breaker import CircuitBreaker, CircuitOpenError
+from .cache import ResponseCache
+from .hedge import Hedger
+from .metrics import RequestMetrics, default_metrics
+from .ratelimit import RateLimiter, SharedRateStore
+from .replay import Recorder, RecordingAdapter, ReplayAdapter
+from .retry import RetryPolicy
+from .singleflight import SingleFlight
+from .timeout import AdaptiveTimeout, cap_timeout, remaining_time
 
-def false_retry(times: int = 3, interval: float = 1):
+
+def false_retry(times: int = None, interval: float = None, policy: RetryPolicy = None):
     """Retry when a func returns false
 
+    If decorated func is a method of `XSession`, its `retry_policy` is used by default,
+    so all wrappers of a session share the same retry policy.
+    Retry stops if current deadline (see `timeout.deadline`) would pass during backoff.
+
     Args:
-        times (int): Times to retry.
-        interval (float): Interval between each retry, in seconds, increase 1s each retry.
+        times (int): Times to retry, override `max_retries` of policy.
+        interval (float): Backoff seconds of first retry, override `backoff_base` of policy.
+        policy (RetryPolicy): Policy used instead of the one of session.
     """
     def decorator(func):
         @wraps(func)
         def decorated_func(*args, **kwargs):
-            for i in range(times + 1):
+            session = args[0] if args and isinstance(args[0], XSession) else None
+            _policy = policy or (session.retry_policy if session else RetryPolicy())
+            if times is not None or interval is not None:
+                _policy = _policy.copy(
+                    max_retries=_policy.max_retries if times is None else times,
+                    backoff_base=_policy.backoff_base if interval is None else interval
+                )
+
+            start = monotonic()
+            for i in range(_policy.max_retries + 1):
                 # retry log
                 if i > 0:
                     logging.getLogger(__name__).warning("Retry func {} {} time.".format(func.__name__, i))
+                    if session:
+                        session._local.is_retry = True  # counted by metrics of next request
 
                 # call func
                 ret = func(*args, **kwargs)
                 if ret:
                     return ret
 
-                # sleep for interval, increase 1s each retry
-                sleep(interval + i)
+                if i >= _policy.max_retries:
+                    break
+
+                # sleep with jittered backoff, or as long as server asked
+                backoff = _policy.get_backoff(i, session.pop_retry_after() if session else None)
+                if _policy.total_time > 0 and monotonic() - start + backoff > _policy.total_time:
+                    logging.getLogger(__name__).error("Retry time budget exhausted in func {}.".format(func.__name__))
+                    return ret
+                remaining = remaining_time()
+                if remaining is not None and backoff >= remaining:
+                    logging.getLogger(__name__).error("Deadline reached in func {}.".format(func.__name__))
+                    return ret
+                sleep(backoff)
 
             # all retry failed
             logging.getLogger(__name__).error("All retries failed in func {}.".format(func.__name__))
@@ -45,18 +96,67 @@ class XSession(requests.Session):
     If anything wrong happened in a request, return an empty `Response` object, keeping url info and logging error info using `logging` module.
     """
 
+    # default (url regex pattern, ttl seconds) used by `enable_cache`
+    CACHE_TTLS = ()
+
+    # auth state synced between sessions of a `SessionPool`, set in order
+    SHARED_ATTRS = ()
+
+    # transport of sessions created later, set by `replay.install`
+    default_replay: ReplayAdapter = None
+    default_recorder: Recorder = None
+
     def __init__(self) -> None:
         """
         Properties:
-            interval (float): Seconds between each request. Minimum to 0.01. Default to 0.01
+            interval (float): Default seconds between each request to the same host. Minimum to 0.01. Default to 0.01
             max_retries (int): max retry times. Default to 3.
+            retry_policy (RetryPolicy): Retry policy used by adapters and `false_retry` wrappers.
             timeout: same as timeout param to `requests.request`, default to 30.
+            adaptive_timeout (AdaptiveTimeout): Timeouts scaled with body size and throughput, used instead of default `timeout`,
+                None means disabled, use `enable_adaptive_timeout` to enable it.
+            rate_limiter (RateLimiter): Per host token bucket limiter, use `set_rate_limit` to config a host.
+            cache (ResponseCache): On-disk GET response cache, None means disabled, use `enable_cache` to enable it.
+            metrics (RequestMetrics): Where request metrics recorded, default to `metrics.default_metrics` shared by all sessions.
+            circuit_breaker (CircuitBreaker): Per host circuit breaker, requests to an open host fail fast with empty `Response`.
+            hedger (Hedger): Hedging of slow GET requests, None means disabled, use `enable_hedging` to enable it.
+            single_flight (SingleFlight): Coalescing of identical GET requests, None means disabled, use `enable_single_flight` to enable it.
+            session_pool (SessionPool): Pool this session is a worker of, None if not in a pool.
+            json_codec (JsonCodec): Codec to parse json responses, default to the fastest installed one.
+            concurrency_limiter (ConcurrencyLimiter): Limiter of parallel jobs fed by responses of this session,
+                None means disabled, use `enable_concurrency_limit` to enable it.
+            replay (ReplayAdapter): Serves recorded responses instead of network, None means disabled, see `enable_replay`.
+            recorder (Recorder): Records responses of network, None means disabled, see `enable_recording`.
+
+        Pool:
+            Default pool of each host keeps 10 connections, use `set_pool` to config a host.
+
+        Deadline:
+            Timeouts are capped by current deadline (see `timeout.deadline`), and requests after it
+            fail fast with empty `Response`.
+
+        Note:
+            Hosts without rate limit are limited by `interval`, idle time will NOT be charged again.
         """
         super().__init__()
         self.logger = logging.getLogger(__name__)
+        self._local = threading.local()
+        self.rate_limiter = RateLimiter()
         self.interval = 0.01
         self.timeout = 30
-        self.max_retries = 3
+        self.adaptive_timeout: AdaptiveTimeout = None
+        self._pool_configs: Dict[str, Tuple[int, int, bool]] = {"": (10, 10, False)}  # host -> (connections, maxsize, block)
+        self.replay: ReplayAdapter = self.default_replay
+        self.recorder: Recorder = self.default_recorder
+        self.retry_policy = RetryPolicy(max_retries=3)
+        self.cache: ResponseCache = None
+        self.metrics: RequestMetrics = default_metrics
+        self.circuit_breaker = CircuitBreaker()
+        self.hedger: Hedger = None
+        self.single_flight: SingleFlight = None
+        self.session_pool = None
+        self.json_codec: JsonCodec = default_codec
+        self.concurrency_limiter: ConcurrencyLimiter = None
 
     @property
     def interval(self):
@@ -65,6 +165,7 @@ class XSession(requests.Session):
     @interval.setter
     def interval(self, value: float):
         self.__interval = max(0.01, value)
+        self.rate_limiter.default = (1 / self.__interval, 1)
 
     @property
     def timeout(self):
@@ -74,20 +175,464 @@ class XSession(requests.Session):
     def timeout(self, value: Union[Tuple[float, float], float]):
         self.__timeout = value
 
+    def enable_adaptive_timeout(self, connect: float = 10, read: float = 30, **kwargs) -> AdaptiveTimeout:
+        """Scale timeouts of requests without explicit timeout with their body size and observed throughput of host.
+
+        Args:
+            connect (float): Connect timeout.
+            read (float): Read timeout of requests without body.
+            kwargs: Other args of `AdaptiveTimeout`.
+        """
+        self.adaptive_timeout = AdaptiveTimeout(connect, read, **kwargs)
+        return self.adaptive_timeout
+
+    def _get_timeout(self, host: str, request: requests.PreparedRequest, timeout) -> Union[Tuple[float, float], float, None]:
+        """Timeout of a request, adapted if it is the default one, and capped by deadline.
+
+        Raises:
+            DeadlineExceeded: If deadline has passed.
+        """
+        if self.adaptive_timeout and timeout == self.timeout:
+            timeout = self.adaptive_timeout.get(host, RequestMetrics._get_body_size(request))
+        return cap_timeout(timeout)
+
     @property
     def max_retries(self):
-        return self.__max_retries
+        return self.retry_policy.max_retries
 
     @max_retries.setter
     def max_retries(self, value: int):
-        self.__max_retries = value
-        # set default adapter max retry
-        self.mount("https://", HTTPAdapter(max_retries=value))
-        self.mount("http://", HTTPAdapter(max_retries=value))
+        self.retry_policy = self.retry_policy.copy(max_retries=value)
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        return self.__retry_policy
+
+    @retry_policy.setter
+    def retry_policy(self, value: RetryPolicy):
+        self.__retry_policy = value
+        # remount adapters with new retry
+        self._remount_adapters()
+
+    def _mount_adapter(self, host: str) -> None:
+        """Mount adapter of a host with its pool config, empty host means default adapter."""
+
+        connections, maxsize, block = self._pool_configs[host]
+        for scheme in ("https://", "http://"):
+            if self.replay is not None:
+                adapter = self.replay
+            else:
+                adapter_class = partial(RecordingAdapter, self.recorder) if self.recorder is not None else HTTPAdapter
+                adapter = adapter_class(
+                    pool_connections=connections, pool_maxsize=maxsize, pool_block=block,
+                    max_retries=self.retry_policy.to_urllib3()
+                )
+            self.mount(scheme + host + ("/" if host else ""), adapter)
+
+    def _remount_adapters(self) -> None:
+        for host in self._pool_configs:
+            self._mount_adapter(host)
+
+    def enable_replay(self, adapter: ReplayAdapter = None, **kwargs) -> ReplayAdapter:
+        """Serve recorded responses instead of network, see `replay.ReplayAdapter`.
+
+        Args:
+            adapter (ReplayAdapter): Adapter to use, None means a new one serving fixtures of this session class.
+            kwargs: Args of a new `ReplayAdapter`, e.g. latency and bandwidth.
+        """
+        if adapter is None:
+            adapter = ReplayAdapter(**kwargs)
+            adapter.add_fixtures(type(self))
+        self.replay = adapter
+        self._remount_adapters()
+        return adapter
+
+    def enable_recording(self, recorder: Recorder = None) -> Recorder:
+        """Record complete responses of network, save them by `Recorder.save` to replay later."""
+        self.replay = None
+        self.recorder = recorder or Recorder()
+        self._remount_adapters()
+        return self.recorder
+
+    def set_pool(self, host: str = "", connections: int = 10, maxsize: int = 10, block: bool = False) -> None:
+        """Set connection pool of a host.
+
+        Args:
+            host (str): Host name (with port if not default), empty string means default pool of all hosts.
+            connections (int): Number of pools (one for each scheme, host and port) to cache.
+            maxsize (int): Max connections kept in pool, should be at least the number of threads using this host.
+            block (bool): Whether wait for a free connection when pool is full, otherwise open a discarded one.
+        """
+        self._pool_configs[host] = (connections, maxsize, block)
+        self._mount_adapter(host)
+
+    def connection_stats(self) -> dict:
+        """Connection reuse statistics of each pool.
+
+        Returns:
+            {
+                "<scheme>://<host>:<port>": {"connections": int, "requests": int, "reuse_rate": float},
+                ...
+            }
+        """
+        stats = {}
+        for adapter in set(self.adapters.values()):
+            for manager in [adapter.poolmanager, *adapter.proxy_manager.values()]:
+                for key in manager.pools.keys():
+                    pool = manager.pools.get(key)
+                    if pool is None:
+                        continue
+                    pool_stats = stats.setdefault(
+                        "{}://{}:{}".format(pool.scheme, pool.host, pool.port),
+                        {"connections": 0, "requests": 0}
+                    )
+                    pool_stats["connections"] += pool.num_connections
+                    pool_stats["requests"] += pool.num_requests
+
+        for pool_stats in stats.values():
+            num_requests = pool_stats["requests"]
+            pool_stats["reuse_rate"] = 1 - pool_stats["connections"] / num_requests if num_requests else 0
+        return stats
+
+    @staticmethod
+    def enable_dns_cache(ttl: float = 300) -> dns.DNSCache:
+        """Enable DNS cache shared by all sessions in process.
+
+        Args:
+            ttl (float): Seconds to keep resolved addresses of a host.
+        """
+        return dns.install(ttl)
+
+    def _open_connection(self, url: str, verify: Union[bool, str] = None) -> bool:
+        """Open a connection to origin of url and put it into pool, without sending any request."""
+
+        verify = self.verify if verify is None else verify
+        proxies = self.proxies or None
+        adapter = self.get_adapter(url)
+        if isinstance(adapter, ReplayAdapter):
+            return True  # nothing to connect
+        try:
+            if hasattr(adapter, "get_connection_with_tls_context"):
+                conn_pool = adapter.get_connection_with_tls_context(requests.Request("HEAD", url).prepare(), verify, proxies, self.cert)
+            else:
+                conn_pool = adapter.get_connection(url, proxies)
+            adapter.cert_verify(conn_pool, url, verify, self.cert)
+
+            # tunnel of proxy is only set up when sending a request
+            if getattr(conn_pool, "proxy", None):
+                return False
+
+            conn = conn_pool._get_conn()
+            conn.timeout = self.timeout[0] if isinstance(self.timeout, tuple) else self.timeout
+            try:
+                conn.connect()
+            except Exception:
+                conn.close()
+                raise
+            conn_pool._put_conn(conn)
+        except Exception as e:
+            self.logger.warning("Failed to prewarm {}:{}".format(url, e))
+            return False
+        return True
+
+    def prewarm(self, hosts: Iterable[str], max_workers: int = 8) -> Dict[str, bool]:
+        """Resolve hosts and open pooled connections to them in parallel.
+
+        Args:
+            hosts (Iterable[str]): Host names (https is used) or urls, e.g. "i.pximg.net", "http://www.kuwo.cn/".
+
+        Returns:
+            {"<host>": bool}, whether a connection is opened.
+        """
+        hosts = list(dict.fromkeys(hosts))
+        if not hosts:
+            return {}
+        urls = [host if "://" in host else "https://{}/".format(host) for host in hosts]
+        with ThreadPoolExecutor(min(max_workers, len(hosts)), thread_name_prefix="xsession-prewarm") as executor:
+            return dict(zip(hosts, executor.map(self._open_connection, urls)))
+
+    def get_shared_state(self) -> dict:
+        """Values of `SHARED_ATTRS`."""
+        return {name: getattr(self, name) for name in self.SHARED_ATTRS}
+
+    def set_shared_state(self, state: dict) -> None:
+        """Set values of `SHARED_ATTRS`, in order of `SHARED_ATTRS`."""
+        for name in self.SHARED_ATTRS:
+            if name in state:
+                setattr(self, name, state[name])
+
+    def pop_retry_after(self) -> Union[float, None]:
+        """Pop `Retry-After` seconds of the last 429/503 response in current thread."""
+        retry_after = getattr(self._local, "retry_after", None)
+        self._local.retry_after = None
+        return retry_after
+
+    def set_rate_limit(self, host: str, rate: float, burst: int = 1) -> None:
+        """Set rate limit for a host.
+
+        Args:
+            host (str): Host name or pattern, e.g. "i.pximg.net", "*.aliyundrive.net".
+            rate (float): Requests per second, <= 0 means unlimited.
+            burst (int): Max requests can be sent at once after idle.
+        """
+        self.rate_limiter.set_limit(host, rate, burst)
+
+    def enable_shared_rate_limit(self, path: PathLike = "tmp/xsession_ratelimit.sqlite3", account: str = "") -> SharedRateStore:
+        """Share rate limits set by `set_rate_limit` with other processes using the same file.
+
+        Args:
+            path (PathLike): SQLite file of shared buckets.
+            account (str): Account the session logged in, different accounts have their own budgets.
+        """
+        store = SharedRateStore(path)
+        self.rate_limiter.share(store, account)
+        return store
+
+    @staticmethod
+    def _get_host(url: str, headers: dict = None) -> str:
+        """Get logical host of a request, `Host` header first."""
+        return (headers or {}).get("Host") or urlsplit(url).hostname or ""
+
+    @staticmethod
+    def _get_logical_url(url: str, headers: dict = None) -> str:
+        """Get url with its logical host, `Host` header replaces netloc of url."""
+        host = (headers or {}).get("Host")
+        if not host:
+            return url
+        components = list(urlsplit(url))
+        components[1] = host
+        return urlunsplit(components)
+
+    def enable_cache(self, cache_dir: PathLike, ttls: Iterable[Tuple[str, float]] = None, max_size: int = 256*1024*1024) -> ResponseCache:
+        """Enable on-disk cache of GET responses.
+
+        Args:
+            cache_dir (PathLike): Folder to store cache.
+            ttls (Iterable[Tuple[str, float]]): (url regex pattern, ttl seconds), only matched urls are cached.
+                None means use `CACHE_TTLS` of class.
+            max_size (int): Max total bytes of cached content.
+        """
+        self.cache = ResponseCache(cache_dir, self.CACHE_TTLS if ttls is None else ttls, max_size)
+        return self.cache
+
+    def cache_stats(self) -> dict:
+        """Statistics of cache, empty if cache disabled."""
+        return self.cache.stats() if self.cache else {}
+
+    def is_host_healthy(self, host: str = None) -> bool:
+        """Whether circuit of host is not open, None means all hosts used by this session."""
+        return self.circuit_breaker.is_healthy(host)
+
+    def enable_hedging(self, percentile: float = 0.95, hosts: Iterable[str] = ("*",), **kwargs) -> Hedger:
+        """Enable hedging of GET requests to hosts.
+
+        Args:
+            percentile (float): Latency percentile of a host to wait before sending a second attempt.
+            hosts (Iterable[str]): Host patterns to hedge.
+            kwargs: Other args of `Hedger`.
+        """
+        self.hedger = Hedger(percentile, hosts=hosts, **kwargs)
+        return self.hedger
+
+    def hedge_stats(self) -> dict:
+        """Statistics of hedging, empty if hedging disabled."""
+        return self.hedger.stats() if self.hedger else {}
+
+    def enable_single_flight(self, memo_time: float = 0) -> SingleFlight:
+        """Enable coalescing of identical GET and HEAD requests.
+
+        Concurrent identical requests share one network call and the same `Response` object,
+        so parsed json of it is also shared, callers should NOT modify it.
+
+        Args:
+            memo_time (float): Seconds to reuse a successful response after it returned, 0 means only share in-flight requests.
+        """
+        self.single_flight = SingleFlight(memo_time, memo_filter=lambda res: res.ok)
+        return self.single_flight
 
-    def request(self, method, url, *args, **kwargs) -> requests.Response:
-        sleep(self.interval)
+    def enable_concurrency_limit(self, initial: int = 4, max_limit: int = 32, **kwargs) -> ConcurrencyLimiter:
+        """Enable an AIMD limiter of parallel jobs, which is decreased on 429, 5xx and timeouts of this session.
+
+        Requests are not gated by the limiter, jobs run by its `map` or `run` are.
+        A limiter can be shared by sessions by assigning `concurrency_limiter`.
+
+        Args:
+            initial (int): Initial number of parallel jobs.
+            max_limit (int): Max number of parallel jobs.
+            kwargs: Other args of `ConcurrencyLimiter`.
+        """
+        self.concurrency_limiter = ConcurrencyLimiter(initial, max_limit=max_limit, **kwargs)
+        return self.concurrency_limiter
+
+    def concurrency_stats(self) -> dict:
+        """Live state of concurrency limiter, empty if disabled."""
+        return self.concurrency_limiter.stats() if self.concurrency_limiter else {}
+
+    def single_flight_stats(self) -> dict:
+        """Statistics of single flight, empty if single flight disabled."""
+        return self.single_flight.stats() if self.single_flight else {}
+
+    @staticmethod
+    def _get_flight_key(request: requests.PreparedRequest) -> str:
+        """Hash of method, logical url, headers and body of a request."""
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf8")
+        elif not isinstance(body, bytes):
+            return ""  # streamed body can not be shared
+
+        sha1 = hashlib.sha1()
+        sha1.update(request.method.encode("utf8"))
+        sha1.update(XSession._get_logical_url(request.url, request.headers).encode("utf8"))
+        for k, v in sorted((k.lower(), v) for k, v in request.headers.items()):
+            sha1.update("\n{}:{}".format(k, v).encode("utf8"))
+        sha1.update(b"\n\n")
+        sha1.update(body)
+        return sha1.hexdigest()
+
+    def _load_json(self, res: requests.Response):
+        """Parse json body of a response once with `json_codec`, shared responses share the parsed result.
+
+        Body is parsed from bytes, unless a charset other than utf-8 is declared.
+
+        Raises:
+            ValueError: If body is not valid json.
+        """
+        json_ = getattr(res, "_xsession_json", None)
+        if json_ is None:
+            data = res.content or b""
+            if res.encoding and "charset" in res.headers.get("Content-Type", "").lower():
+                try:
+                    if codecs.lookup(res.encoding).name != "utf-8":
+                        data = res.text
+                except LookupError:
+                    pass
+            json_ = self.json_codec.loads(data)
+            res._xsession_json = json_
+        return json_
+
+    def _get_hedge_request(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        """Make request of second attempt, can be overridden to send it to another address."""
+        return request.copy()
+
+    def _hedged_send(self, host: str, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        """Send with hedging, attempts return at headers and content is loaded by winner if not stream."""
+
+        stream = kwargs.pop("stream", False)
+        hedge_request = self._get_hedge_request(request)
+
+        def _attempt(request_: requests.PreparedRequest):
+            context = contextvars.copy_context()  # keep deadline in hedger thread
+
+            def func():
+                self._local.hedging = True  # no nested hedging in redirects
+                try:
+                    return context.run(self._send, self._get_host(request_.url, request_.headers), request_, stream=True, **kwargs)
+                finally:
+                    self._local.hedging = False
+            return func
+
+        res = self.hedger.run(host, _attempt(request), _attempt(hedge_request))
+        if not stream:
+            res.content  # load content
+        return res
+
+    def _send(self, host: str, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        """Send request to network, with deadline, circuit breaker, rate limiting and metrics."""
+
+        kwargs["timeout"] = self._get_timeout(host, request, kwargs.get("timeout"))
+        if not self.circuit_breaker.allow(host):
+            raise CircuitOpenError("Circuit of {} is open, request refused.".format(host), request=request)
+        self.rate_limiter.acquire(host)
+
+        retries = 1 if getattr(self._local, "is_retry", False) else 0
+        self._local.is_retry = False
+        start = perf_counter()
+        try:
+            res = super().send(request, **kwargs)
+        except Exception as e:
+            self.metrics.record(request, None, perf_counter() - start, e, retries)
+            self.circuit_breaker.record(host)
+            if self.concurrency_limiter and isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+                self.concurrency_limiter.on_overload()
+            raise
+
+        # add retries done by adapter
+        latency = perf_counter() - start
+        retries += len(getattr(getattr(res.raw, "retries", None), "history", None) or ())
+        self.metrics.record(request, res, latency, retries=retries)
+        self.circuit_breaker.record(host, res)
+        if self.adaptive_timeout and res.ok:
+            self.adaptive_timeout.observe(host, RequestMetrics._get_body_size(request), latency)
+        if self.concurrency_limiter:
+            if res.status_code == 429 or res.status_code >= 500:
+                self.concurrency_limiter.on_overload()
+            elif res.ok:
+                self.concurrency_limiter.on_success(latency)
+        return res
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        # only share complete content of idempotent requests
+        if self.single_flight and request.method in ("GET", "HEAD") and not kwargs.get("stream"):
+            flight_key = self._get_flight_key(request)
+            if flight_key:
+                return self.single_flight.do(flight_key, lambda: self._send_cached(request, **kwargs))
+        return self._send_cached(request, **kwargs)
+
+    def _send_cached(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        """Send request through cache if enabled."""
+
+        # only cache complete content
+        cache_key = ""
+        if self.cache and not kwargs.get("stream"):
+            logical_url = self._get_logical_url(request.url, request.headers)
+            cache_key = self.cache.get_key(request.method, logical_url, request.headers)
+
+        cache_meta = {}
+        if cache_key:
+            cache_meta = self.cache.get(cache_key)
+            if cache_meta and self.cache.is_fresh(cache_meta):
+                res = self.cache.load(cache_key, cache_meta, request)
+                if res is not None:
+                    return res
+                cache_meta = {}
+            # conditional request if any validator
+            request.headers.update(self.cache.get_validators(cache_meta))
+
+        host = self._get_host(request.url, request.headers)
+        hedge = self.hedger and request.method in ("GET", "HEAD") and self.hedger.match(host) \
+            and not getattr(self._local, "hedging", False)
+
+        def send() -> requests.Response:
+            if hedge:
+                return self._hedged_send(host, request, **kwargs)
+            return self._send(host, request, **kwargs)
+
+        res = send()
+
+        if cache_key:
+            if res.status_code == 304 and cache_meta:
+                cached_res = self.cache.load(cache_key, cache_meta, request, revalidated=True)
+                if cached_res is not None:
+                    return cached_res
+                # cached content lost after lookup, get full content again
+                res.close()
+                for name in self.cache.get_validators(cache_meta):
+                    request.headers.pop(name, None)
+                res = send()
+            self.cache.miss()
+            self.cache.store(cache_key, logical_url, res)
+
+        return res
+
+    def request(self, method, url, *args, expected_status: Iterable[int] = (), **kwargs) -> requests.Response:
+        """Send a request, return an empty `Response` on exception.
+
+        Args:
+            expected_status (Iterable[int]): Error status codes caller handles itself, not logged as warnings.
+        """
         kwargs.setdefault("timeout", self.timeout)  # timeout to avoid suspended
+        self._local.retry_after = None  # only the latest request of this thread decides Retry-After
         try:
             res = super().request(method, url, *args, **kwargs)
         except Exception as e:
@@ -96,6 +641,238 @@ class XSession(requests.Session):
             res.url = url  # keep url info
             return res
         else:
-            if not res.ok:
+            if not res.ok and res.status_code not in expected_status:
                 self.logger.warning("{}:{}:{}".format(url, res.status_code, res.text))
+                self._local.retry_after = self.retry_policy.get_retry_after(res)
             return res
+
+    @staticmethod
+    def _get_content_range(res: requests.Response) -> Tuple[Optional[int], Optional[int]]:
+        """(start, total) of `Content-Range` header, None if unknown."""
+        match = re.match(r"bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)", res.headers.get("Content-Range", ""))
+        if not match:
+            return (None, None)
+        start, total = match.groups()
+        return (int(start) if start else None, int(total) if total != "*" else None)
+
+    @false_retry()
+    def download_to(self, url: str, path: PathLike, *, chunk_size: int = 1024*1024, resume: bool = True, **kwargs) -> bool:
+        """Stream content of url to a file.
+
+        Content is written to "<path>.part", and renamed to `path` after its length is verified,
+        so an existing `path` is always complete. A partial file left by last failure is continued with `Range` header,
+        or restarted if server does not support it. Failures are retried by `retry_policy`.
+
+        Args:
+            url (str): Url to download.
+            path (PathLike): File path to save.
+            chunk_size (int): Bytes of each chunk read and written, bounds memory used.
+            resume (bool): Whether continue an existing partial file.
+            kwargs: Other args to `get`.
+
+        Returns:
+            bool: Whether file is downloaded.
+        """
+
+        path = Path(path)
+        part_path = path.with_name(path.name + ".part")
+        offset = part_path.stat().st_size if resume and part_path.is_file() else 0
+
+        # length can only be verified without content encoding
+        headers = {"Accept-Encoding": "identity", **(kwargs.pop("headers", None) or {})}
+        if offset > 0:
+            headers["Range"] = "bytes={}-".format(offset)
+
+        res = self.get(url, headers=headers, stream=True, **kwargs)
+        try:
+            start, total = self._get_content_range(res)
+            if res.status_code == 416 and offset > 0:
+                # partial file may be complete already, otherwise download again
+                if total != offset:
+                    part_path.unlink()
+                    return False
+                os.replace(part_path, path)
+                return True
+            if res.status_code == 206 and offset > 0 and start == offset:
+                mode = "ab"
+            elif res.status_code == 200:
+                offset, mode = 0, "wb"  # range not supported, restart
+            else:
+                self.logger.error("Failed to download {}:{}".format(url, res.status_code))
+                return False
+
+            expected = None
+            if res.headers.get("Content-Encoding", "identity") == "identity" and res.headers.get("Content-Length", "").isdigit():
+                expected = offset + int(res.headers["Content-Length"])
+
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            with part_path.open(mode) as f:
+                for chunk in res.iter_content(chunk_size):
+                    f.write(chunk)
+        except Exception as e:
+            # keep partial file to resume
+            self.logger.error("{}:{}".format(url, e))
+            return False
+        finally:
+            if res.raw is not None:
+                res.close()
+
+        size = part_path.stat().st_size
+        if expected is not None and size != expected:
+            self.logger.error("Incomplete download {}: {}/{} bytes.".format(url, size, expected))
+            if size > expected:
+                part_path.unlink()
+            return False
+
+        os.replace(part_path, path)
+        return True
+
+    @staticmethod
+    def _close_response(res: requests.Response) -> None:
+        if res.raw is not None:
+            res.close()
+
+    @staticmethod
+    def _split_ranges(start: int, end: int, count: int, min_size: int) -> Iterable[Tuple[int, int]]:
+        """Split [start, end) into at most `count` inclusive byte ranges of at least `min_size` bytes."""
+        length = end - start
+        if length <= 0:
+            return []
+        count = max(1, min(count, ceil(length / max(min_size, 1))))
+        size = ceil(length / count)
+        return [(first, min(first + size, end) - 1) for first in range(start, end, size)]
+
+    def _download_segment(
+        self,
+        url: str,
+        part_path: Path,
+        start: int,
+        end: int,
+        res: requests.Response = None,
+        *,
+        chunk_size: int,
+        headers: dict,
+        **kwargs
+    ) -> bool:
+        """Write bytes [start, end] of url at their position in part file, retry from where it failed.
+
+        Args:
+            res (Response): Opened response of this segment, used by first attempt.
+        """
+
+        written = 0
+        length = end - start + 1
+        for attempt in range(self.retry_policy.max_retries + 1):
+            if res is None:
+                if attempt > 0:
+                    backoff = self.retry_policy.get_backoff(attempt - 1, self.pop_retry_after())
+                    remaining = remaining_time()
+                    if remaining is not None and backoff >= remaining:
+                        self.logger.error("Deadline reached when retrying segment {}-{} of {}.".format(start + written, end, url))
+                        return False
+                    self.logger.warning("Retry segment {}-{} of {} {} time.".format(start + written, end, url, attempt))
+                    sleep(backoff)
+                res = self.get(url, headers={**headers, "Range": "bytes={}-{}".format(start + written, end)}, stream=True, **kwargs)
+                if res.status_code != 206 or self._get_content_range(res)[0] != start + written:
+                    self.logger.error("Failed to download segment {}-{} of {}:{}".format(start + written, end, url, res.status_code))
+                    self._close_response(res)
+                    res = None
+                    continue
+
+            try:
+                with part_path.open("r+b") as f:
+                    f.seek(start + written)
+                    for chunk in res.iter_content(chunk_size):
+                        chunk = chunk[:length - written]
+                        f.write(chunk)
+                        written += len(chunk)
+                        if written >= length:
+                            break
+            except Exception as e:
+                self.logger.error("{}:{}".format(url, e))
+            finally:
+                self._close_response(res)
+                res = None
+
+            if written >= length:
+                return True
+        return False
+
+    def download_segmented(
+        self,
+        url: str,
+        path: PathLike,
+        *,
+        segments: int = 4,
+        min_segment_size: int = 4*1024*1024,
+        chunk_size: int = 1024*1024,
+        **kwargs
+    ) -> bool:
+        """Download a file by concurrent range requests.
+
+        The first range request also probes size and range support. If server does not support ranges,
+        or file is smaller than `min_segment_size`, it is the same as `download_to`.
+        Otherwise file is split into at most `segments` ranges, which are written at their positions
+        of a preallocated "<path>.segpart" file, and each failed range is retried on its own.
+        The file is renamed to `path` after all ranges are completed.
+
+        Args:
+            url (str): Url to download.
+            path (PathLike): File path to save.
+            segments (int): Max concurrent range requests.
+            min_segment_size (int): Min bytes of a range.
+            chunk_size (int): Bytes of each chunk read and written.
+            kwargs: Other args to `get`.
+
+        Returns:
+            bool: Whether file is downloaded.
+        """
+
+        path = Path(path)
+        headers = {"Accept-Encoding": "identity", **(kwargs.pop("headers", None) or {})}
+        if segments <= 1:
+            return self.download_to(url, path, chunk_size=chunk_size, headers=headers, **kwargs)
+
+        res = self.get(url, headers={**headers, "Range": "bytes=0-{}".format(min_segment_size - 1)}, stream=True, **kwargs)
+        start, total = self._get_content_range(res)
+        if res.status_code != 206 or start != 0 or not total:
+            self._close_response(res)
+            return self.download_to(url, path, chunk_size=chunk_size, headers=headers, **kwargs)
+
+        # first range is the probe, the rest are split into other segments
+        ranges = self._split_ranges(min_segment_size, total, segments - 1, min_segment_size)
+
+        # not the ".part" of download_to, a preallocated file can not be resumed by appending
+        part_path = path.with_name(path.name + ".segpart")
+        try:
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            with part_path.open("wb") as f:
+                f.truncate(total)
+        except OSError as e:
+            self.logger.error("{}:{}".format(part_path, e))
+            self._close_response(res)
+            return False
+
+        first = (0, min(min_segment_size, total) - 1)
+        with ThreadPoolExecutor(1 + len(ranges), thread_name_prefix="xsession-segment") as executor:
+            # each segment runs in a copy of current context to keep deadline
+            futures = [executor.submit(
+                contextvars.copy_context().run,
+                self._download_segment, url, part_path, *first, res, chunk_size=chunk_size, headers=headers, **kwargs
+            )]
+            futures.extend(
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self._download_segment, url, part_path, *range_, chunk_size=chunk_size, headers=headers, **kwargs
+                )
+                for range_ in ranges
+            )
+            success = all([future.result() for future in futures])
+
+        if not success:
+            self.logger.error("Failed to download {} by segments.".format(url))
+            part_path.unlink()
+            return False
+
+        os.replace(part_path, path)
+        return True
@@ -60,7 +60,7 @@ class BilibiliBase(XSession):
 
         # check valid json data
         try:
-            json_ = res.json()
+            json_ = self._load_json(res)
         except ValueError:
             self.logger.error("{}:JsonValueError.".format(res.url))
             return {}
@@ -124,6 +124,7 @@ class BilibiliBase(XSession):
         )
         return self._check_response(res)
 
+    @false_retry()
     def _get_web_nav(self) -> dict:
         """
         Returns:
@@ -133,6 +134,7 @@ class BilibiliBase(XSession):
         res = self.get(BilibiliBase.URL_web_interface_nav)
         return self._check_response(res)
 
+    @false_retry()
     def _get_dynamic_detail(self, dynamic_id: str) -> dict:
         """Get details of a dynamic.
 
@@ -317,7 +319,7 @@ class BilibiliBase(XSession):
         if res.status_code != 200:
             return False
         try:
-            return (res.json()["code"] == 0)
+            return (self._load_json(res)["code"] == 0)
         except ValueError:
             return False
 
@@ -0,0 +1,150 @@
+# -*- coding: UTF-8 -*-
+
+import logging
+import threading
+from fnmatch import fnmatchcase
+from time import monotonic
+from typing import Dict, Iterable, List, Tuple
+
+import requests
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised when a request is refused by an open circuit."""
+
+
+class _Circuit:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_time: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = _Circuit.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+
+
+class CircuitBreaker:
+    """Per host circuit breaker.
+
+    A host is opened after `failure_threshold` consecutive failures, then all requests to it fail fast.
+    After `recovery_time` seconds it becomes half open, and only one probe request is allowed,
+    the circuit is closed if the probe succeeds, otherwise opened again.
+
+    Failures are exceptions (e.g. timeout, connection error) and `failure_status` responses.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        recovery_time: float = 60,
+        *,
+        failure_status: Iterable[int] = (500, 502, 503, 504)
+    ) -> None:
+        """
+        Args:
+            failure_threshold (int): Consecutive failures to open a circuit, <= 0 means never open.
+            recovery_time (float): Seconds an open circuit waits before half open.
+            failure_status (Iterable[int]): Status codes counted as failure.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.default = (failure_threshold, recovery_time)
+        self.failure_status = frozenset(failure_status)
+        self._configs: Dict[str, Tuple[int, float]] = {}
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host: str, failure_threshold: int, recovery_time: float) -> None:
+        """Set thresholds of a host or host pattern (e.g. "*.aliyundrive.net")."""
+        with self._lock:
+            self._configs[host] = (failure_threshold, recovery_time)
+            self._circuits.clear()
+
+    def _get_circuit(self, host: str) -> _Circuit:
+        """Need lock."""
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            config = self._configs.get(host)
+            if config is None:
+                config = next((c for p, c in self._configs.items() if fnmatchcase(host, p)), self.default)
+            circuit = self._circuits[host] = _Circuit(*config)
+        return circuit
+
+    def _get_state(self, circuit: _Circuit) -> str:
+        """Update and get state, need lock."""
+        if circuit.state == _Circuit.OPEN and monotonic() - circuit.opened_at >= circuit.recovery_time:
+            circuit.state = _Circuit.HALF_OPEN
+            circuit.probing = False
+        return circuit.state
+
+    def allow(self, host: str) -> bool:
+        """Whether a request to host can be sent now, a half open host allows only one probe."""
+
+        with self._lock:
+            circuit = self._get_circuit(host)
+            state = self._get_state(circuit)
+            if state == _Circuit.CLOSED:
+                return True
+            if state == _Circuit.HALF_OPEN and not circuit.probing:
+                circuit.probing = True
+                return True
+            circuit.rejected += 1
+            return False
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            circuit = self._get_circuit(host)
+            if circuit.state != _Circuit.CLOSED:
+                self.logger.warning("Circuit of {} closed.".format(host))
+            circuit.state = _Circuit.CLOSED
+            circuit.failures = 0
+            circuit.probing = False
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            circuit = self._get_circuit(host)
+            circuit.failures += 1
+            if circuit.state == _Circuit.HALF_OPEN or \
+                    (circuit.failure_threshold > 0 and circuit.failures >= circuit.failure_threshold):
+                if circuit.state != _Circuit.OPEN:
+                    self.logger.warning("Circuit of {} opened after {} failures.".format(host, circuit.failures))
+                circuit.state = _Circuit.OPEN
+                circuit.opened_at = monotonic()
+                circuit.probing = False
+
+    def record(self, host: str, res: requests.Response = None) -> None:
+        """Record result of a request, None `res` means failed with exception."""
+        if res is None or res.status_code in self.failure_status:
+            self.record_failure(host)
+        else:
+            self.record_success(host)
+
+    def get_state(self, host: str) -> str:
+        """["closed" | "open" | "half_open"]"""
+        with self._lock:
+            return self._get_state(self._get_circuit(host))
+
+    def is_healthy(self, host: str = None) -> bool:
+        """Whether host is not open, None means all known hosts."""
+        if host is not None:
+            return self.get_state(host) != _Circuit.OPEN
+        return not self.open_hosts()
+
+    def open_hosts(self) -> List[str]:
+        with self._lock:
+            return [host for host, circuit in self._circuits.items() if self._get_state(circuit) == _Circuit.OPEN]
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {"<host>": {"state": str, "failures": int, "rejected": int}}
+        """
+        with self._lock:
+            return {
+                host: {"state": self._get_state(circuit), "failures": circuit.failures, "rejected": circuit.rejected}
+                for host, circuit in self._circuits.items()
+            }
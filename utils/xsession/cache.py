@@ -0,0 +1,242 @@
+# -*- coding: UTF-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from os import PathLike
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class ResponseCache:
+    """On-disk cache of GET responses, used by `XSession.send`.
+
+    Each entry is stored as two files in `cache_dir`:
+        <key>.json: status, headers, validators and expire time.
+        <key>.bin: raw content.
+
+    Only urls matching a rule in `ttls` are cached. Expired entries with `ETag` or `Last-Modified`
+    are revalidated with a conditional request, a 304 response refreshes the entry.
+    Total content size is bounded by `max_size`, least recently used entries are evicted first.
+    """
+
+    # headers not valid any more for cached content
+    DROP_HEADERS = frozenset(["content-encoding", "transfer-encoding", "content-length", "connection", "set-cookie"])
+
+    def __init__(
+        self,
+        cache_dir: PathLike,
+        ttls: Iterable[Tuple[str, float]] = (),
+        max_size: int = 256*1024*1024,
+        *,
+        vary_headers: Iterable[str] = ("Accept-Language", "Authorization", "Cookie")
+    ) -> None:
+        """
+        Args:
+            cache_dir (PathLike): Folder to store entries.
+            ttls (Iterable[Tuple[str, float]]): (url regex pattern, ttl seconds), first matched pattern is used.
+            max_size (int): Max total bytes of cached content.
+            vary_headers (Iterable[str]): Request headers added to cache key, "Cookie" keeps responses of logged in and logged out apart.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttls: List[Tuple[re.Pattern, float]] = [(re.compile(p), ttl) for p, ttl in ttls]
+        self.max_size = max_size
+        self.vary_headers = tuple(vary_headers)
+
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> content size, in lru order
+        self._size = 0
+        self._stats = {"hits": 0, "misses": 0, "revalidated": 0, "stores": 0, "evictions": 0, "bytes_served": 0}
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Load existed entries in order of last access."""
+
+        entries = []
+        for meta_path in self.cache_dir.glob("*.json"):
+            content_path = meta_path.with_suffix(".bin")
+            if not content_path.is_file():
+                meta_path.unlink()
+                continue
+            stat = content_path.stat()
+            entries.append((stat.st_mtime, meta_path.stem, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+
+    def get_ttl(self, url: str) -> float:
+        """Get ttl of url, 0 means not cacheable."""
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    def get_key(self, method: str, url: str, headers: dict) -> str:
+        """Make cache key, return empty string if not cacheable.
+
+        Args:
+            url (str): Logical url including query string.
+        """
+        if method.upper() != "GET" or self.get_ttl(url) <= 0:
+            return ""
+
+        key = "{} {}".format(method.upper(), url)
+        for name in self.vary_headers:
+            key += "\n{}:{}".format(name.lower(), headers.get(name, ""))
+        return hashlib.sha1(key.encode("utf8")).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        return self.cache_dir.joinpath(key + ".json"), self.cache_dir.joinpath(key + ".bin")
+
+    def get(self, key: str) -> dict:
+        """Get entry meta info, empty if not exist."""
+
+        meta_path, _ = self._paths(key)
+        with self._lock:
+            if key not in self._index:
+                return {}
+            try:
+                return json.loads(meta_path.read_text(encoding="utf8"))
+            except (OSError, ValueError):
+                self._remove(key)
+                return {}
+
+    @staticmethod
+    def is_fresh(meta: dict) -> bool:
+        return meta.get("expires", 0) > time.time()
+
+    @staticmethod
+    def get_validators(meta: dict) -> dict:
+        """Conditional request headers of an entry."""
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load(self, key: str, meta: dict, request: requests.PreparedRequest, *, revalidated: bool = False) -> requests.Response:
+        """Make a `Response` from a cached entry, return None if content lost."""
+
+        meta_path, content_path = self._paths(key)
+        try:
+            content = content_path.read_bytes()
+        except OSError:
+            with self._lock:
+                self._remove(key)
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            self._stats["revalidated" if revalidated else "hits"] += 1
+            self._stats["bytes_served"] += len(content)
+        os.utime(content_path)  # record access time for lru
+
+        if revalidated:
+            meta["expires"] = time.time() + self.get_ttl(meta["url"])
+            meta_path.write_text(json.dumps(meta), encoding="utf8")
+
+        res = requests.Response()
+        res.status_code = meta["status_code"]
+        res.reason = meta.get("reason", "")
+        res.headers = CaseInsensitiveDict(meta["headers"])
+        res.headers["Content-Length"] = str(len(content))
+        res.encoding = meta.get("encoding")
+        res._content = content
+        res.url = request.url
+        res.request = request
+        res.elapsed = timedelta(0)
+        res.from_cache = True
+        return res
+
+    def miss(self) -> None:
+        with self._lock:
+            self._stats["misses"] += 1
+
+    def store(self, key: str, url: str, res: requests.Response) -> None:
+        """Store a complete 200 response."""
+
+        if res.status_code != 200:
+            return
+
+        content = res.content
+        meta = {
+            "url": url,
+            "status_code": res.status_code,
+            "reason": res.reason,
+            "headers": {k: v for k, v in res.headers.items() if k.lower() not in self.DROP_HEADERS},
+            "encoding": res.encoding,
+            "etag": res.headers.get("ETag", ""),
+            "last_modified": res.headers.get("Last-Modified", ""),
+            "expires": time.time() + self.get_ttl(url),
+        }
+
+        meta_path, content_path = self._paths(key)
+        with self._lock:
+            # too large to cache
+            if len(content) > self.max_size:
+                return
+            self._remove(key)
+            try:
+                content_path.write_bytes(content)
+                meta_path.write_text(json.dumps(meta), encoding="utf8")
+            except OSError as e:
+                self.logger.warning("Failed to write cache {}:{}".format(url, e))
+                self._remove(key)
+                return
+            self._index[key] = len(content)
+            self._size += len(content)
+            self._stats["stores"] += 1
+            self._evict()
+
+    def _remove(self, key: str) -> None:
+        """Remove an entry, need lock."""
+        self._size -= self._index.pop(key, 0)
+        for path in self._paths(key):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        """Evict lru entries until size under limit, need lock."""
+        while self._size > self.max_size and self._index:
+            key = next(iter(self._index))
+            self._remove(key)
+            self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    def stats(self) -> dict:
+        """Cache statistics.
+
+        Returns:
+            {
+                "entries": int, "size": int,
+                "hits": int, "misses": int, "revalidated": int,
+                "stores": int, "evictions": int, "bytes_served": int,
+                "hit_rate": float
+            }
+        """
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._index), size=self._size)
+        lookups = stats["hits"] + stats["revalidated"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["revalidated"]) / lookups if lookups else 0
+        return stats
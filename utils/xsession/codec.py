@@ -0,0 +1,151 @@
+# -*- coding: UTF-8 -*-
+
+"""Json codecs used to parse response bodies.
+
+A fast parser is used if installed (orjson, then ujson), otherwise stdlib `json`.
+All codecs parse utf-8 bytes directly, without decoding them to `str` first.
+
+Run this file to benchmark codecs over fixtures in `responses` folder:
+    python utils/xsession/codec.py
+"""
+
+import json
+from typing import Any, Dict, List, Union
+
+
+class JsonCodec:
+    """Stdlib `json` codec, also the fallback of other codecs."""
+
+    name = "json"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """Parse json from utf-8 bytes or str.
+
+        Raises:
+            ValueError: If data is not valid json.
+        """
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        """Serialize obj to compact utf-8 bytes."""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf8")
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._orjson.loads(data)
+        except ValueError:
+            # e.g. BOM, NaN or integers out of 64 bits, which stdlib accepts
+            return super().loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._orjson.dumps(obj)
+        except TypeError:
+            return super().dumps(obj)
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self) -> None:
+        import ujson
+        self._ujson = ujson
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._ujson.loads(data)
+        except ValueError:
+            return super().loads(data)
+
+
+_codec_classes = [OrjsonCodec, UjsonCodec, JsonCodec]
+
+
+def get_codec(name: str = None) -> JsonCodec:
+    """Get a codec by name, None means the fastest installed one.
+
+    Args:
+        name (str): ["orjson" | "ujson" | "json"]
+
+    Raises:
+        ValueError: If name is unknown.
+        ImportError: If parser of name is not installed.
+    """
+    if name is not None:
+        for codec_class in _codec_classes:
+            if codec_class.name == name:
+                return codec_class()
+        raise ValueError("Unknown json codec {}.".format(name))
+
+    for codec_class in _codec_classes:
+        try:
+            return codec_class()
+        except ImportError:
+            continue
+    return JsonCodec()
+
+
+# used by sessions unless replaced
+default_codec = get_codec()
+
+
+def _benchmark(number: int = 20) -> Dict[str, Dict[str, float]]:
+    """Milliseconds per parse of each fixture.
+
+    "requests" is what `Response.json()` does: decode body to str then parse it with stdlib.
+    """
+    from pathlib import Path
+    from timeit import timeit
+
+    codecs: List[JsonCodec] = []
+    for codec_class in _codec_classes:
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            pass
+
+    results = {}
+    for path in sorted(Path(__file__).with_name("responses").glob("*/*.json")):
+        data = path.read_bytes()
+        if not data.strip():
+            continue
+        try:
+            json.loads(data)
+        except ValueError:
+            continue  # not a json fixture
+
+        name = "{}/{}".format(path.parent.name, path.name)
+        results[name] = {"size": len(data)}
+        results[name]["requests"] = timeit(lambda: json.loads(data.decode("utf8")), number=number) / number * 1000
+        for codec in codecs:
+            results[name][codec.name] = timeit(lambda: codec.loads(data), number=number) / number * 1000
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark json codecs over response fixtures.")
+    parser.add_argument("-n", dest="number", type=int, help="Times to parse each fixture.", default=20)
+    args = parser.parse_args()
+
+    results = _benchmark(args.number)
+    columns = [k for k in next(iter(results.values()), {}) if k != "size"]
+    print("{:<60}{:>10}".format("fixture", "bytes") + "".join("{:>12}".format(c + " ms") for c in columns))
+    totals = dict.fromkeys(columns, 0.0)
+    for name, result in results.items():
+        print("{:<60}{:>10}".format(name, result["size"]) + "".join("{:>12.4f}".format(result[c]) for c in columns))
+        for c in columns:
+            totals[c] += result[c]
+    print("{:<60}{:>10}".format("total", "") + "".join("{:>12.4f}".format(totals[c]) for c in columns))
+    for c in columns[1:]:
+        print("{}: {:.2f}x faster than requests".format(c, totals["requests"] / totals[c] if totals[c] else 0))
+    print("default codec: {}".format(default_codec.name))
@@ -0,0 +1,155 @@
+# -*- coding: UTF-8 -*-
+
+"""Adaptive concurrency of parallel jobs.
+
+A `ConcurrencyLimiter` gates jobs (e.g. page downloads, illust uploads) with `map`,
+and learns how many jobs can run at the same time from feedback of requests:
+sessions the limiter attached to report each response in `XSession._send`.
+
+Example:
+    limiter = pixiv.enable_concurrency_limit(initial=2, max_limit=8)
+    paths = limiter.map(lambda url: pixiv.download_page(url, ...), page_urls)
+"""
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Any, Callable, Iterable, List
+
+
+class ConcurrencyLimiter:
+    """AIMD limit of in-flight jobs.
+
+    The limit is raised by `increase` after each `limit` healthy responses (i.e. once per round),
+    and multiplied by `decrease` on 429, 5xx or timeouts, at most once per `cooldown` seconds
+    so a burst of errors from the same round only counts once.
+    A response is healthy if its latency is within `latency_tolerance` times of the baseline latency,
+    slower responses hold the limit.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        *,
+        increase: float = 1,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2,
+        cooldown: float = 1
+    ) -> None:
+        """
+        Args:
+            initial (int): Initial limit.
+            min_limit (int): Min limit.
+            max_limit (int): Max limit, also number of threads used by `map`.
+            increase (float): Limit added each round of healthy responses.
+            decrease (float): Factor multiplied to limit on overload.
+            latency_tolerance (float): Max ratio of latency to baseline of a healthy response.
+            cooldown (float): Min seconds between two decreases.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._baseline = None  # baseline latency, follows minimum quickly and increase slowly
+        self._decreased_at = 0.0
+        self._stats = {"jobs": 0, "successes": 0, "overloads": 0, "decreases": 0, "max_in_flight": 0}
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Wait for a slot of job.
+
+        Returns:
+            bool: False if no slot is available in `timeout` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._in_flight < self.limit, timeout):
+                return False
+            self._in_flight += 1
+            self._stats["jobs"] += 1
+            self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._in_flight)
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self, latency: float) -> None:
+        """Feedback of a successful response."""
+        with self._cond:
+            self._stats["successes"] += 1
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                self._baseline += 0.01 * (latency - self._baseline)
+
+            if latency > self.latency_tolerance * self._baseline:
+                return  # queueing somewhere, hold
+            if self._limit < self.max_limit:
+                self._limit = min(self.max_limit, self._limit + self.increase / self.limit)
+                self._cond.notify_all()
+
+    def on_overload(self) -> None:
+        """Feedback of a 429, 5xx or timeout."""
+        with self._cond:
+            self._stats["overloads"] += 1
+            now = monotonic()
+            if now - self._decreased_at < self.cooldown:
+                return
+            self._decreased_at = now
+            self._limit = max(self.min_limit, self._limit * self.decrease)
+            self._stats["decreases"] += 1
+        self.logger.info("Concurrency limit decreased to {}.".format(self.limit))
+
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Call func in a slot, or directly if current thread already holds a slot of this limiter."""
+        if getattr(self._local, "holding", False):
+            return func(*args, **kwargs)
+        self.acquire()
+        self._local.holding = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._local.holding = False
+            self.release()
+
+    def map(self, func: Callable, items: Iterable) -> List[Any]:
+        """Call `func(item)` for each item concurrently under the limit, results are in order of items.
+
+        Nested calls from a job of this limiter run one by one in the job's slot,
+        so they can not deadlock waiting for slots held by their callers.
+        """
+        items = list(items)
+        if not items:
+            return []
+        if getattr(self._local, "holding", False):
+            return [func(item) for item in items]
+
+        with ThreadPoolExecutor(min(self.max_limit, len(items)), thread_name_prefix="xsession-limiter") as executor:
+            # each job runs in a copy of current context to keep deadline
+            futures = [executor.submit(contextvars.copy_context().run, self.run, func, item) for item in items]
+            return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {"limit": int, "in_flight": int, "baseline_latency": float, "jobs": int, "successes": int,
+            "overloads": int, "decreases": int, "max_in_flight": int}
+        """
+        with self._cond:
+            return {"limit": self.limit, "in_flight": self._in_flight, "baseline_latency": self._baseline, **self._stats}
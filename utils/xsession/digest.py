@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+
+"""Digests of files for rapid upload, computed in one pass.
+
+`digest_file` maps a file and hashes it window by window while kernel reads ahead the next window,
+v1 proof code is taken from the same mapping.
+
+Example:
+    digest = digest_file("a.mp4", proof_token=access_token)
+"""
+
+import hashlib
+import mmap
+import os
+from base64 import b64encode
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Optional
+
+WINDOW_SIZE = 8*1024*1024  # bytes hashed at a time, multiple of page size
+
+
+def get_proof_code(filepath: PathLike, access_token: str) -> str:
+    """v1 proof code, 8 bytes at offset decided by access token, base64 encoded."""
+    filepath = Path(filepath)
+    size = filepath.stat().st_size
+    if size <= 0:
+        return ""
+    with filepath.open("rb") as f:
+        f.seek(_get_proof_offset(access_token, size))
+        return b64encode(f.read(8)).decode("utf8")
+
+
+def _get_proof_offset(access_token: str, size: int) -> int:
+    md5_token = hashlib.md5(access_token.encode("utf8")).hexdigest()
+    return int(md5_token[0:16], 16) % size
+
+
+def _hash_mapped(mapped: mmap.mmap, size: int, proof_offset: Optional[int]) -> Dict[str, str]:
+    sha1 = hashlib.sha1()
+    willneed = getattr(mmap, "MADV_WILLNEED", None)
+
+    for offset in range(0, size, WINDOW_SIZE):
+        # kernel reads next window while this one is hashed
+        next_offset = offset + WINDOW_SIZE
+        if willneed is not None and next_offset < size:
+            mapped.madvise(willneed, next_offset, min(WINDOW_SIZE, size - next_offset))
+
+        with memoryview(mapped)[offset:next_offset] as window:
+            sha1.update(window)
+
+    digest = {"size": size, "sha1": sha1.hexdigest().upper(), "proof_code": ""}
+    if proof_offset is not None:
+        digest["proof_code"] = b64encode(mapped[proof_offset:proof_offset + 8]).decode("utf8")
+    return digest
+
+
+def digest_file(filepath: PathLike, *, proof_token: str = "") -> Dict[str, str]:
+    """SHA-1 and proof code of a file in one pass.
+
+    Args:
+        filepath (PathLike): File to hash.
+        proof_token (str): Access token to compute v1 proof code, empty to skip.
+
+    Returns:
+        {"size": int, "sha1": str, "proof_code": str}, sha1 is in upper case.
+    """
+    with Path(filepath).open("rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= 0:
+            return {"size": 0, "sha1": hashlib.sha1().hexdigest().upper(), "proof_code": ""}
+
+        proof_offset = _get_proof_offset(proof_token, size) if proof_token else None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _hash_mapped(mapped, size, proof_offset)
@@ -0,0 +1,141 @@
+# -*- coding: UTF-8 -*-
+
+"""Process-wide DNS cache.
+
+`install` makes all new connections (of any session) resolve hosts through `default_dns_cache`,
+so a host is resolved once per `ttl` instead of once per connection.
+"""
+
+import ipaddress
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Dict, Iterable, List, Tuple
+
+import urllib3.util.connection
+
+
+class DNSCache:
+    """Cache of `socket.getaddrinfo` results.
+
+    System resolver does not expose record TTLs, so each host is cached for a fixed `ttl`,
+    failed lookups are not cached.
+    """
+
+    def __init__(self, ttl: float = 300) -> None:
+        """
+        Args:
+            ttl (float): Seconds to keep resolved addresses of a host.
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}  # (host, port) -> (expire time, addresses)
+        self._stats = {"hits": 0, "misses": 0}
+
+    def resolve(self, host: str, port: int = 443) -> List[str]:
+        """Resolve host to ip addresses, in order of resolver.
+
+        Raises:
+            OSError: If resolving failed.
+        """
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > monotonic():
+                self._stats["hits"] += 1
+                return list(entry[1])
+            self._stats["misses"] += 1
+
+        addresses = []
+        for *_, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, addresses)
+        return list(addresses)
+
+    def prewarm(self, hosts: Iterable[str], port: int = 443, max_workers: int = 8) -> Dict[str, bool]:
+        """Resolve hosts in parallel.
+
+        Returns:
+            {"<host>": bool}, whether host is resolved.
+        """
+        def _resolve(host: str) -> bool:
+            try:
+                return bool(self.resolve(host, port))
+            except OSError:
+                return False
+
+        hosts = list(dict.fromkeys(hosts))
+        if not hosts:
+            return {}
+        with ThreadPoolExecutor(min(max_workers, len(hosts)), thread_name_prefix="xsession-dns") as executor:
+            return dict(zip(hosts, executor.map(_resolve, hosts)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {"hits": int, "misses": int, "entries": int}
+        """
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
+
+
+default_dns_cache = DNSCache()
+
+_create_connection = urllib3.util.connection.create_connection
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+    except ValueError:
+        return False
+    return True
+
+
+def _cached_create_connection(address, *args, **kwargs):
+    """Same as `urllib3.util.connection.create_connection`, but resolve host through `default_dns_cache`."""
+
+    host, port = address
+    if _is_ip(host):
+        return _create_connection(address, *args, **kwargs)
+
+    try:
+        addresses = default_dns_cache.resolve(host, port)
+    except OSError:
+        # let urllib3 raise its own error
+        return _create_connection(address, *args, **kwargs)
+
+    # try each address like urllib3 does
+    err = None
+    for ip in addresses:
+        try:
+            return _create_connection((ip, port), *args, **kwargs)
+        except OSError as e:
+            err = e
+    if err is not None:
+        raise err
+    return _create_connection(address, *args, **kwargs)
+
+
+def install(ttl: float = None) -> DNSCache:
+    """Resolve hosts of all new connections through `default_dns_cache`.
+
+    Args:
+        ttl (float): Set ttl of cache, None means unchanged.
+    """
+    if ttl is not None:
+        default_dns_cache.ttl = ttl
+    urllib3.util.connection.create_connection = _cached_create_connection
+    return default_dns_cache
+
+
+def uninstall() -> None:
+    urllib3.util.connection.create_connection = _create_connection
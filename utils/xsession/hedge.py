@@ -0,0 +1,193 @@
+# -*- coding: UTF-8 -*-
+
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from fnmatch import fnmatchcase
+from time import perf_counter
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Hedger:
+    """Hedge idempotent requests to cut tail latency.
+
+    If the first attempt has not received headers after the `percentile` latency observed on its host,
+    a second attempt is started if a worker is free, the first one arriving wins and the other one is closed when it returns.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        *,
+        hosts: Iterable[str] = ("*",),
+        min_samples: int = 20,
+        window: int = 200,
+        min_delay: float = 0.05,
+        max_workers: int = 8
+    ) -> None:
+        """
+        Args:
+            percentile (float): Latency percentile to wait before hedging, in (0, 1).
+            hosts (Iterable[str]): Host patterns can be hedged.
+            min_samples (int): Samples needed for a host before hedging it.
+            window (int): Number of recent latencies kept for each host.
+            min_delay (float): Min seconds to wait before hedging.
+            max_workers (int): Threads used to run attempts, requests are not hedged when all are busy.
+        """
+        self.percentile = percentile
+        self.hosts = tuple(hosts)
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="xsession-hedge")
+        self._max_workers = max_workers
+        self._busy = 0  # workers reserved by attempts, so attempts never wait in queue of executor
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._results: Deque[float] = deque(maxlen=window * 10)
+        self._stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "saved_seconds": 0.0}
+
+    def match(self, host: str) -> bool:
+        return any(fnmatchcase(host, p) for p in self.hosts)
+
+    def observe(self, host: str, latency: float) -> None:
+        """Record a time-to-headers latency of host."""
+        with self._lock:
+            latencies = self._latencies.get(host)
+            if latencies is None:
+                latencies = self._latencies[host] = deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def get_delay(self, host: str) -> Optional[float]:
+        """Seconds to wait before hedging, None if not enough samples."""
+        with self._lock:
+            latencies = list(self._latencies.get(host, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, _percentile(latencies, self.percentile))
+
+    def _reserve_worker(self) -> bool:
+        """Reserve a free worker for an attempt, False if all are busy."""
+        with self._lock:
+            if self._busy >= self._max_workers:
+                return False
+            self._busy += 1
+            return True
+
+    def _run_attempt(self, attempt: Callable[[], requests.Response], started: Future = None) -> Tuple[requests.Response, float]:
+        """Run an attempt in a reserved worker, returns response and its latency."""
+        begin = perf_counter()
+        if started is not None:
+            started.set_result(begin)
+        try:
+            res = attempt()
+            return res, perf_counter() - begin
+        finally:
+            with self._lock:
+                self._busy -= 1
+
+    def run(
+        self,
+        host: str,
+        primary: Callable[[], requests.Response],
+        backup: Callable[[], requests.Response]
+    ) -> requests.Response:
+        """Run primary attempt, and backup attempt if primary is slow.
+
+        Attempts should return as soon as headers arrived (i.e. stream=True).
+        Exceptions are raised only if all attempts failed.
+        """
+        delay = self.get_delay(host)
+        with self._lock:
+            self._stats["requests"] += 1
+
+        start = perf_counter()
+        if delay is None or not self._reserve_worker():
+            # not enough samples, or no worker for a backup, run without hedging
+            res = primary()
+            latency = perf_counter() - start
+            self.observe(host, latency)
+            with self._lock:
+                self._results.append(latency)
+            return res
+
+        # delay starts when primary is sent
+        started = Future()
+        attempts = [self._executor.submit(self._run_attempt, primary, started)]
+        done, _ = wait(attempts, timeout=max(0, started.result() + delay - perf_counter()))
+        if not done and self._reserve_worker():
+            attempts.append(self._executor.submit(self._run_attempt, backup))
+            with self._lock:
+                self._stats["hedged"] += 1
+
+        # first successful attempt wins
+        pending = set(attempts)
+        winner: Future = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = future
+                    break
+        latency = perf_counter() - start
+
+        # close losers when they return
+        for future in attempts:
+            if future is not winner:
+                future.add_done_callback(self._close_loser(host, start, latency, future is attempts[0]))
+
+        if winner is None:
+            # all failed, raise exception of primary
+            return attempts[0].result()[0]
+
+        res, send_latency = winner.result()
+        if winner is attempts[0]:
+            self.observe(host, send_latency)
+        else:
+            with self._lock:
+                self._stats["hedge_wins"] += 1
+        with self._lock:
+            self._results.append(latency)
+        return res
+
+    def _close_loser(self, host: str, start: float, win_latency: float, is_primary: bool) -> Callable[[Future], None]:
+        def callback(future: Future):
+            latency = perf_counter() - start
+            if future.exception() is None:
+                res, send_latency = future.result()
+                res.close()
+                if is_primary:
+                    # primary latency is still a valid sample
+                    self.observe(host, send_latency)
+                    with self._lock:
+                        self._stats["saved_seconds"] += latency - win_latency
+        return callback
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {
+                "requests": int, "hedged": int, "hedge_wins": int, "hedge_rate": float,
+                "saved_seconds": float, "p50": float, "p95": float, "p99": float
+            }
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            results = list(self._results)
+        stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else 0
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            stats[name] = _percentile(results, q)
+        return stats
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,180 @@
+# -*- coding: UTF-8 -*-
+
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, perf_counter
+from typing import Dict, Iterable, List, Optional
+
+
+class _Node:
+    def __init__(self, ip: str) -> None:
+        self.ip = ip
+        self.latency: Optional[float] = None  # connect latency of last successful probe
+        self.healthy = False  # not usable until probed
+        self.failures = 0  # consecutive failures of requests
+        self.current_weight = 0
+        self.picked = 0
+
+
+class IPPool:
+    """Pool of ip addresses for each logical host, used by domain fronting.
+
+    All ips of a host are probed concurrently by tcp connect, and requests are spread over
+    healthy ips by smooth weighted round-robin, faster ips get higher weights.
+    An ip is evicted after probe failed or `fail_threshold` consecutive request failures,
+    and comes back if a later probe succeeds.
+
+    Until the first probe of a host finishes, its default ip is used.
+    """
+
+    def __init__(
+        self,
+        ranges: Dict[str, Iterable[str]],
+        defaults: Dict[str, str] = None,
+        *,
+        port: int = 443,
+        probe_timeout: float = 3,
+        probe_interval: float = 600,
+        fail_threshold: int = 2,
+        max_weight: int = 10
+    ) -> None:
+        """
+        Args:
+            ranges (Dict[str, Iterable[str]]): All ips of each host.
+            defaults (Dict[str, str]): Ip of each host used before probed or when no ip healthy.
+            port (int): Port to probe.
+            probe_timeout (float): Seconds to wait for a connection.
+            probe_interval (float): Seconds between probes of a host, probes are started in background by `pick`.
+            fail_threshold (int): Consecutive request failures to evict an ip.
+            max_weight (int): Weight of the fastest ip, an ip twice slower gets half of it.
+        """
+        self.logger = logging.getLogger(__name__)
+        self.defaults = dict(defaults or {})
+        self.port = port
+        self.probe_timeout = probe_timeout
+        self.probe_interval = probe_interval
+        self.fail_threshold = fail_threshold
+        self.max_weight = max_weight
+
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, List[_Node]] = {host: [_Node(ip) for ip in dict.fromkeys(ips)] for host, ips in ranges.items()}
+        self._probed_at: Dict[str, float] = {}  # host -> start time of last probe, also marks a running probe
+
+    def __contains__(self, host: str) -> bool:
+        return host in self._nodes
+
+    def _probe_ip(self, ip: str) -> Optional[float]:
+        """Connect latency of ip, None if failed."""
+        start = perf_counter()
+        try:
+            with socket.create_connection((ip, self.port), self.probe_timeout):
+                return perf_counter() - start
+        except OSError:
+            return None
+
+    def probe(self, hosts: Iterable[str] = None, max_workers: int = 16) -> Dict[str, Dict[str, Optional[float]]]:
+        """Probe all ips of hosts concurrently, None means all hosts.
+
+        Returns:
+            {"<host>": {"<ip>": latency or None}}
+        """
+        hosts = list(self._nodes) if hosts is None else [h for h in hosts if h in self._nodes]
+        with self._lock:
+            for host in hosts:
+                self._probed_at[host] = monotonic()
+            targets = [(host, node.ip) for host in hosts for node in self._nodes[host]]
+        if not targets:
+            return {}
+
+        with ThreadPoolExecutor(min(max_workers, len(targets)), thread_name_prefix="xsession-probe") as executor:
+            latencies = list(executor.map(lambda target: self._probe_ip(target[1]), targets))
+
+        results: Dict[str, Dict[str, Optional[float]]] = {}
+        for (host, ip), latency in zip(targets, latencies):
+            results.setdefault(host, {})[ip] = latency
+
+        with self._lock:
+            for host, ip_latencies in results.items():
+                for node in self._nodes[host]:
+                    latency = ip_latencies.get(node.ip)
+                    if latency is None:
+                        if node.healthy:
+                            self.logger.warning("Evict {} of {}, probe failed.".format(node.ip, host))
+                        node.healthy = False
+                    else:
+                        node.latency = latency
+                        node.healthy = True
+                        node.failures = 0
+        return results
+
+    def _probe_background(self, host: str) -> None:
+        """Start a probe of host if it is due, need lock."""
+        probed_at = self._probed_at.get(host)
+        if probed_at is not None and monotonic() - probed_at < self.probe_interval:
+            return
+        self._probed_at[host] = monotonic()
+        threading.Thread(target=self.probe, args=([host],), name="xsession-probe", daemon=True).start()
+
+    def _get_weight(self, node: _Node, best_latency: float) -> int:
+        return max(1, round(self.max_weight * best_latency / max(node.latency, 1e-6)))
+
+    def pick(self, host: str, exclude: Iterable[str] = ()) -> str:
+        """Pick an ip of host by weighted round-robin.
+
+        Returns:
+            Ip, or default ip of host if no ip healthy, or host itself if it has no ip.
+        """
+        exclude = set(exclude)
+        with self._lock:
+            if host not in self._nodes:
+                return self.defaults.get(host, host)
+            self._probe_background(host)
+
+            nodes = [node for node in self._nodes[host] if node.healthy and node.ip not in exclude]
+            if not nodes:
+                default = self.defaults.get(host, host)
+                if default not in exclude:
+                    return default
+                others = [node.ip for node in self._nodes[host] if node.ip not in exclude]
+                return others[0] if others else default
+
+            best_latency = min(node.latency for node in nodes)
+            total = 0
+            for node in nodes:
+                weight = self._get_weight(node, best_latency)
+                node.current_weight += weight
+                total += weight
+            picked = max(nodes, key=lambda node: node.current_weight)
+            picked.current_weight -= total
+            picked.picked += 1
+            return picked.ip
+
+    def report(self, host: str, ip: str, ok: bool) -> None:
+        """Report result of a request sent to ip of host."""
+        with self._lock:
+            node = next((node for node in self._nodes.get(host, ()) if node.ip == ip), None)
+            if node is None:
+                return
+            if ok:
+                node.failures = 0
+                return
+            node.failures += 1
+            if node.healthy and node.failures >= self.fail_threshold:
+                self.logger.warning("Evict {} of {} after {} failures.".format(ip, host, node.failures))
+                node.healthy = False
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {"<host>": {"<ip>": {"healthy": bool, "latency": float, "failures": int, "picked": int}}}
+        """
+        with self._lock:
+            return {
+                host: {
+                    node.ip: {"healthy": node.healthy, "latency": node.latency, "failures": node.failures, "picked": node.picked}
+                    for node in nodes
+                }
+                for host, nodes in self._nodes.items()
+            }
@@ -1,5 +1,4 @@
 from os import PathLike
-from pathlib import Path
 from typing import Iterator
 import requests
 from .base import XSession, false_retry
@@ -26,7 +25,8 @@ class KuwoMusicBase(XSession):
     URL_singles_songinfo_and_lrc = "http://m.kuwo.cn/newh5/singles/songinfoandlrc"
 
     def __init__(self, interval: float = 0.01) -> None:
-        super().__init__(interval=interval)
+        super().__init__()
+        self.interval = interval
         self.get(KuwoMusicBase.URL_host)  # get csrf token for the first time
 
     def _get_csrf(self):
@@ -54,7 +54,7 @@ class KuwoMusicBase(XSession):
 
         # check valid json data
         try:
-            json_ = res.json()
+            json_ = self._load_json(res)
         except ValueError:
             self.logger.error("{}:JsonValueError.".format(res.url))
             return {}
@@ -275,15 +275,10 @@ class KuwoMusic(KuwoMusicBase):
             self.logger.error("KuwoMusic:Failed to get song url {}.".format(song_id))
             return False
 
-        song_data = self._get_song_data(url_info["url"])
-        if not song_data:
+        if not self.download_to(url_info["url"], save_path):
             self.logger.error("Failed to get song data {}.".format(song_id))
             return False
 
-        with Path(save_path).open("wb") as f:
-            for chunk in song_data:
-                f.write(chunk)
-
         return True
 
     def get_music_info(self, song_id: str) -> dict:
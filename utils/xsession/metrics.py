@@ -0,0 +1,193 @@
+# -*- coding: UTF-8 -*-
+
+import json
+import re
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+# upper bounds of latency buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def normalize_path(path: str) -> str:
+    """Make a path template by replacing variable segments.
+
+    Examples:
+        "/ajax/illust/88548686/pages" ==> "/ajax/illust/{id}/pages"
+        "/img-original/img/2021/03/19/00/00/00/88548686_p0.png" ==> "/img-original/img/{id}/{id}/{id}/{id}/{id}/{id}/{id}_p{id}.png"
+        "/dS4p88hh%2F889478%2F65e061ea71b133b3..." ==> "/{hash}"
+    """
+    parts = []
+    for part in path.split("/"):
+        if part.isdigit():
+            part = "{id}"
+        elif len(part) >= 32 or re.fullmatch(r"[0-9a-fA-F]{16,}", part):
+            part = "{hash}"
+        else:
+            part = re.sub(r"\d{4,}|(?<=_p)\d+", "{id}", part)
+        parts.append(part)
+    return "/".join(parts)
+
+
+class _EndpointMetrics:
+    def __init__(self) -> None:
+        self.count = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.status: Dict[str, int] = {}
+        self.exceptions: Dict[str, int] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "latency_sum": self.latency_sum,
+            "latency_buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.latency_buckets)),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "retries": self.retries,
+            "status": dict(self.status),
+            "exceptions": dict(self.exceptions),
+        }
+
+
+class RequestMetrics:
+    """Metrics of requests, labeled by (method, host, path template).
+
+    Recorded by `XSession.send` for each request sent to network, cached responses are not counted.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._endpoints: Dict[Tuple[str, str, str], _EndpointMetrics] = {}
+
+    @staticmethod
+    def get_labels(request: requests.PreparedRequest) -> Tuple[str, str, str]:
+        """(method, logical host, path template) of a request."""
+        components = urlsplit(request.url)
+        host = request.headers.get("Host") or components.hostname or ""
+        return (request.method, host, normalize_path(components.path))
+
+    @staticmethod
+    def _get_body_size(request: requests.PreparedRequest) -> int:
+        body = request.body
+        if isinstance(body, (bytes, str)):
+            return len(body)
+        return int(request.headers.get("Content-Length", 0) or 0)
+
+    @staticmethod
+    def _get_content_size(res: requests.Response) -> int:
+        # do not consume stream content
+        if res._content_consumed and isinstance(res._content, bytes):
+            return len(res._content)
+        try:
+            return int(res.headers.get("Content-Length", 0))
+        except ValueError:
+            return 0
+
+    def record(
+        self,
+        request: requests.PreparedRequest,
+        res: requests.Response = None,
+        latency: float = 0,
+        exception: Exception = None,
+        retries: int = 0
+    ) -> None:
+        """Record a request.
+
+        Args:
+            res (Response): Response, None if exception raised.
+            latency (float): Seconds until response headers received.
+            exception (Exception): Exception raised by request.
+            retries (int): Retry times of this request.
+        """
+        labels = self.get_labels(request)
+        bytes_sent = self._get_body_size(request)
+        bytes_received = self._get_content_size(res) if res is not None else 0
+
+        with self._lock:
+            endpoint = self._endpoints.get(labels)
+            if endpoint is None:
+                endpoint = self._endpoints[labels] = _EndpointMetrics()
+            endpoint.count += 1
+            endpoint.latency_sum += latency
+            endpoint.latency_buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            endpoint.bytes_sent += bytes_sent
+            endpoint.bytes_received += bytes_received
+            endpoint.retries += retries
+            if res is not None:
+                status = str(res.status_code)
+                endpoint.status[status] = endpoint.status.get(status, 0) + 1
+            if exception is not None:
+                name = type(exception).__name__
+                endpoint.exceptions[name] = endpoint.exceptions.get(name, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+
+    def to_dict(self) -> dict:
+        """
+        Returns:
+            {"<method> <host><path>": {"count": int, "latency_sum": float, "latency_buckets": {"<le>": int}, ...}}
+        """
+        with self._lock:
+            return {
+                "{} {}{}".format(*labels): endpoint.to_dict()
+                for labels, endpoint in sorted(self._endpoints.items())
+            }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix: str = "xsession") -> str:
+        """Export in Prometheus text format."""
+
+        def _labels(labels: Iterable[Tuple[str, str]]) -> str:
+            return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels) + "}"
+
+        families = {
+            "request_duration_seconds": ("histogram", []),
+            "request_bytes_sent_total": ("counter", []),
+            "request_bytes_received_total": ("counter", []),
+            "request_retries_total": ("counter", []),
+            "responses_total": ("counter", []),
+            "request_exceptions_total": ("counter", []),
+        }
+        with self._lock:
+            for (method, host, path), endpoint in sorted(self._endpoints.items()):
+                base = [("method", method), ("host", host), ("path", path)]
+
+                samples = families["request_duration_seconds"][1]
+                cumulative = 0
+                for le, n in zip([*map(str, LATENCY_BUCKETS), "+Inf"], endpoint.latency_buckets):
+                    cumulative += n
+                    samples.append(("_bucket", base + [("le", le)], cumulative))
+                samples.append(("_sum", base, endpoint.latency_sum))
+                samples.append(("_count", base, endpoint.count))
+
+                families["request_bytes_sent_total"][1].append(("", base, endpoint.bytes_sent))
+                families["request_bytes_received_total"][1].append(("", base, endpoint.bytes_received))
+                families["request_retries_total"][1].append(("", base, endpoint.retries))
+                for status, n in sorted(endpoint.status.items()):
+                    families["responses_total"][1].append(("", base + [("status", status)], n))
+                for name, n in sorted(endpoint.exceptions.items()):
+                    families["request_exceptions_total"][1].append(("", base + [("exception", name)], n))
+
+        lines = []
+        for name, (type_, samples) in families.items():
+            lines.append("# TYPE {}_{} {}".format(prefix, name, type_))
+            for suffix, labels, value in samples:
+                lines.append("{}_{}{}{} {}".format(prefix, name, suffix, _labels(labels), value))
+
+        return "\n".join(lines) + "\n"
+
+
+# shared by all sessions unless replaced, so a run can be exported at once
+default_metrics = RequestMetrics()
@@ -0,0 +1,201 @@
+# -*- coding: UTF-8 -*-
+
+"""Cache of drive path to file id, so paths are resolved without listing every folder on the way.
+
+`PathCache` is a trie of names, filled by list and create responses, and invalidated by file id
+when a file or folder is moved, renamed or trashed (with all paths under it).
+
+Example:
+    cache = PathCache("tmp/aliyundrive_paths.json")  # load entries of previous runs
+    file_id, depth = cache.lookup("pixiv/123/456")  # deepest known folder, list from there
+    ...
+    cache.save()
+"""
+
+import json
+import re
+import threading
+import time
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+
+def split_path(path: Union[PathLike, str, Iterable[str]]) -> Tuple[str, ...]:
+    """Names of a drive path, slash or backslash separated, e.g. "a\\b/c" ==> ("a", "b", "c")."""
+    if isinstance(path, (str, PathLike)):
+        path = re.split(r"[\\/]", str(path))
+    return tuple(name for name in path if name and name != ".")
+
+
+class _Node:
+    __slots__ = ("name", "file_id", "updated", "parent", "children")
+
+    def __init__(self, name: str, parent: Optional["_Node"]) -> None:
+        self.name = name
+        self.file_id: Optional[str] = None  # None for a folder on the way to a known path
+        self.updated = 0.0
+        self.parent = parent
+        self.children: Dict[str, "_Node"] = {}
+
+    def to_dict(self) -> dict:
+        return {"file_id": self.file_id, "updated": self.updated, "children": {k: v.to_dict() for k, v in self.children.items()}}
+
+
+class PathCache:
+    """Trie of path names to file ids, relative to "root", entries expire after `ttl` seconds."""
+
+    def __init__(self, path: PathLike = None, ttl: float = 24*3600) -> None:
+        """
+        Args:
+            path (PathLike): Json file to load from and save to, None to keep in memory only.
+            ttl (float): Seconds an entry is trusted, files may be changed by other clients.
+        """
+        self.path = Path(path) if path else None
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._root = _Node("", None)
+        self._root.file_id = "root"
+        self._ids: Dict[str, _Node] = {"root": self._root}
+        self._stats = {"hits": 0, "misses": 0}
+
+        if self.path and self.path.is_file():
+            self.load(self.path)
+
+    def _is_valid(self, node: _Node, now: float) -> bool:
+        return node.file_id is not None and (node is self._root or now - node.updated < self.ttl)
+
+    def lookup(self, path: Union[PathLike, str, Iterable[str]]) -> Tuple[str, int]:
+        """Deepest known file id on a path.
+
+        Returns:
+            (file_id, depth): Id of first `depth` names of path, a hit if depth is number of names.
+        """
+        names = split_path(path)
+        now = time.time()
+        with self._lock:
+            node = self._root
+            file_id, depth = "root", 0
+            for i, name in enumerate(names):
+                node = node.children.get(name)
+                if node is None:
+                    break
+                if node.file_id is not None:
+                    if not self._is_valid(node, now):
+                        break  # later names may also have changed
+                    file_id, depth = node.file_id, i + 1
+
+            if names:
+                self._stats["hits" if depth == len(names) else "misses"] += 1
+            return file_id, depth
+
+    def get(self, path: Union[PathLike, str, Iterable[str]]) -> str:
+        """File id of path, empty if not known."""
+        names = split_path(path)
+        file_id, depth = self.lookup(names)
+        return file_id if depth == len(names) else ""
+
+    def put(self, parent_file_id: str, path: Union[PathLike, str, Iterable[str]], file_id: str) -> None:
+        """Add path relative to a folder, ignored if the folder is not in cache."""
+        names = split_path(path)
+        if not names or not file_id:
+            return
+        now = time.time()
+        with self._lock:
+            node = self._ids.get(parent_file_id)
+            if node is None:
+                return
+
+            for name in names:
+                child = node.children.get(name)
+                if child is None:
+                    child = node.children[name] = _Node(name, node)
+                node = child
+
+            # a file id only has one path
+            moved = self._ids.get(file_id)
+            if moved is not None and moved is not node:
+                self._detach(moved)
+            if node.file_id is not None and node.file_id != file_id:
+                self._drop_ids(node)  # replaced, e.g. overwritten file or a new folder of same name
+            node.file_id = file_id
+            node.updated = now
+            self._ids[file_id] = node
+
+    def invalidate(self, file_id: str) -> None:
+        """Remove a file or folder, and all paths under it."""
+        with self._lock:
+            node = self._ids.get(file_id)
+            if node is not None and node is not self._root:
+                self._detach(node)
+
+    def _drop_ids(self, node: _Node) -> None:
+        nodes = [node]
+        while nodes:
+            current = nodes.pop()
+            if current.file_id is not None and self._ids.get(current.file_id) is current:
+                del self._ids[current.file_id]
+            nodes.extend(current.children.values())
+        node.children = {}
+
+    def _detach(self, node: _Node) -> None:
+        self._drop_ids(node)
+        node.file_id = None
+        if node.parent is not None and node.parent.children.get(node.name) is node:
+            del node.parent.children[node.name]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._root.children = {}
+            self._ids = {"root": self._root}
+
+    def load(self, path: PathLike) -> int:
+        """Add entries saved by `save`, expired entries are dropped.
+
+        Returns:
+            int: Number of entries loaded.
+        """
+        try:
+            data = json.loads(Path(path).read_text("utf8"))
+        except (OSError, ValueError):
+            return 0
+
+        now = time.time()
+        count = 0
+        with self._lock:
+            nodes = [(self._root, data.get("children", {}))]
+            while nodes:
+                parent, children = nodes.pop()
+                for name, child_data in children.items():
+                    child = parent.children.get(name) or _Node(name, parent)
+                    file_id = child_data.get("file_id")
+                    if file_id and now - child_data.get("updated", 0) < self.ttl and file_id not in self._ids:
+                        child.file_id = file_id
+                        child.updated = child_data["updated"]
+                        self._ids[file_id] = child
+                        count += 1
+                    elif child.file_id is None and not child_data.get("children"):
+                        continue  # nothing useful under it
+                    parent.children[name] = child
+                    nodes.append((child, child_data.get("children", {})))
+        return count
+
+    def save(self, path: PathLike = None) -> None:
+        """Save entries to a json file, default to `path` of cache."""
+        path = Path(path) if path else self.path
+        if not path:
+            return
+        with self._lock:
+            data = self._root.to_dict()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), "utf8")
+        tmp_path.replace(path)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {"hits": int, "misses": int, "entries": int}
+        """
+        with self._lock:
+            return {**self._stats, "entries": len(self._ids) - 1}
@@ -7,6 +7,9 @@ from typing import Any, Iterator, List, Tuple, Union
 import bs4
 import requests
 from .base import XSession, false_retry
+from .breaker import CircuitOpenError
+from .ippool import IPPool
+from .timeout import DeadlineExceeded
 from urllib.parse import urlsplit, urlunsplit
 
 PIXIV_HOSTS = {
@@ -60,6 +63,21 @@ PIXIV_HOSTS = {
     "g-client-proxy.pixiv.net": "210.140.131.222"
 }
 
+# all nodes of a host, requests are spread over them by `IPPool` when domain fronting
+PIXIV_HOST_RANGES = {
+    "s.pximg.net": ["210.140.92.{}".format(i) for i in range(138, 148)],
+    "i.pximg.net": ["210.140.92.{}".format(i) for i in range(138, 148)],
+    # *.pixiv.net 210.140.131.(199-223, 226-229) and 210.140.131.(144-153), see comments of `PIXIV_HOSTS`
+    **{
+        host: ["210.140.131.{}".format(i) for i in [*range(199, 224), *range(226, 230)]]
+        for host, ip in PIXIV_HOSTS.items() if ip == "210.140.131.222"
+    },
+    **{
+        host: ["210.140.131.{}".format(i) for i in range(144, 154)]
+        for host, ip in PIXIV_HOSTS.items() if ip == "210.140.131.145"
+    },
+}
+
 
 class PixivBase(XSession):
     # lang=zh
@@ -98,6 +116,13 @@ class PixivBase(XSession):
     URL_php_rpc_recommender = "https://www.pixiv.net/rpc/recommender.php"  # ?type=illust&sample_illusts=88548686&num_recommendations=500
     URL_php_bookmark_add = "https://www.pixiv.net/bookmark_add.php"  # mode:"add" type:"user" user_id:"" tag:"" restrict:"" format:"json"
 
+    # cache ttls, urls are logical urls even domain fronting
+    CACHE_TTLS = (
+        (r"^https://www\.pixiv\.net/ranking\.php\?", 3600),
+        (r"^https://www\.pixiv\.net/ajax/illust/\d+(/pages)?$", 6*3600),
+        (r"^https://www\.pixiv\.net/ajax/user/\d+/profile/(top|all)$", 6*3600),
+    )
+
     def _check_response(self, res: requests.Response) -> Union[dict, list]:
         """Check response."""
 
@@ -105,7 +130,7 @@ class PixivBase(XSession):
             return {}
 
         try:
-            json_ = res.json()
+            json_ = self._load_json(res)
         except ValueError:
             self.logger.error("{}:JsonValueError.".format(res.url))
             return {}
@@ -125,7 +150,7 @@ class PixivBase(XSession):
             return {}
 
         try:
-            json_ = res.json()
+            json_ = self._load_json(res)
         except ValueError:
             self.logger.error("{}:JsonValueError.".format(res.url))
             return {}
@@ -139,6 +164,7 @@ class PixivBase(XSession):
         """
         Properties:
             domain_fronting (bool): Whether use domain fronting.
+            ip_pool (IPPool): Ips used by domain fronting, requests to a host are spread over its healthy ips in `PIXIV_HOST_RANGES`.
 
         Note:
             When use domain fronting, it will replace `domain` of url to ip address, 
@@ -151,8 +177,17 @@ class PixivBase(XSession):
         """
         super().__init__()
         self.headers["Referer"] = PixivBase.URL_www
+        self.ip_pool = IPPool(PIXIV_HOST_RANGES, PIXIV_HOSTS)
         self.domain_fronting = False
 
+        # ajax and php api share one budget, images have their own
+        self.set_rate_limit("www.pixiv.net", 5, 10)
+        self.set_rate_limit("*.pximg.net", 10, 20)
+
+        # keep more connections for images, also for their fronting ips
+        for host in ("i.pximg.net", *PIXIV_HOST_RANGES["i.pximg.net"]):
+            self.set_pool(host, maxsize=20)
+
     @property
     def domain_fronting(self):
         return self.__domain_fronting
@@ -181,7 +216,7 @@ class PixivBase(XSession):
                 kwargs["headers"]["Host"] = components[1]
 
             # replace netloc
-            components[1] = PIXIV_HOSTS.get(components[1], components[1])
+            components[1] = self.ip_pool.pick(components[1])
 
             # NOT verify
             kwargs["verify"] = False
@@ -190,22 +225,43 @@ class PixivBase(XSession):
 
         return super().request(method, url, *args, **kwargs)
 
-    # GET method
+    def _open_connection(self, url: str, verify: Union[bool, str] = None) -> bool:
+        """Connect to fronting ip when domain fronting."""
+        if self.domain_fronting:
+            components = list(urlsplit(url))
+            components[1] = self.ip_pool.pick(components[1])
+            url, verify = urlunsplit(components), False
+        return super()._open_connection(url, verify)
 
-    @false_retry()
-    def _get_page(self, page_url: str) -> bytes:
-        """
-        Args:
-            page_url (str): url to get page from.
+    def _get_hedge_request(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        """Send hedged request to another node when domain fronting."""
 
-        Returns:
-            Return empty bytes when failed.
-        """
-        res = self.get(page_url)
-        if res.status_code != 200:
-            self.logger.error("Failed to get page from {}.".format(page_url))
-            return b""  # Need to make bool False
-        return res.content
+        hedge_request = super()._get_hedge_request(request)
+        host = request.headers.get("Host")
+        if self.domain_fronting and host in self.ip_pool:
+            components = list(urlsplit(hedge_request.url))
+            components[1] = self.ip_pool.pick(host, exclude=[components[1]])
+            hedge_request.url = urlunsplit(components)
+        return hedge_request
+
+    def _send(self, host: str, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        """Report result of fronting ip to `ip_pool`."""
+
+        ip = urlsplit(request.url).hostname
+        if not self.domain_fronting or host not in self.ip_pool or ip == host:
+            return super()._send(host, request, **kwargs)
+
+        try:
+            res = super()._send(host, request, **kwargs)
+        except (CircuitOpenError, DeadlineExceeded):
+            raise  # refused before sent
+        except Exception:
+            self.ip_pool.report(host, ip, False)
+            raise
+        self.ip_pool.report(host, ip, res.status_code < 500)
+        return res
+
+    # GET method
 
     @false_retry()
     def _get_top_illust(self, mode="all") -> dict:
@@ -481,13 +537,9 @@ class Pixiv(PixivBase):
             self.logger.info("Page file {} already exist, skip download.".format(page_save_path.as_posix()))
             return True
 
-        data = self._get_page(page_url)
-
-        if not data:
+        if not self.download_segmented(page_url, page_save_path):
             self.logger.error("Failed to download page {}.".format(page_url))
             return False
-
-        Path(page_save_path).write_bytes(data)
         return True
 
     def download_illust(self, illust_id: str, illust_save_folder: PathLike) -> List[Path]:
@@ -514,15 +566,17 @@ class Pixiv(PixivBase):
             self.logger.error("Failed to get pages info and download.")
             return []
 
-        result = []
-        flag = True
-        for page_info in pages_info:
-            page_url: str = page_info["urls"]["original"]
-            page_save_path = illust_save_folder.joinpath(page_url.split("/")[-1])
-            if not self.download_page(page_url, page_save_path):
-                flag = False
-                continue
-            result.append(page_save_path)
+        page_urls: List[str] = [page_info["urls"]["original"] for page_info in pages_info]
+        page_save_paths = [illust_save_folder.joinpath(page_url.split("/")[-1]) for page_url in page_urls]
+
+        # pages are downloaded in parallel if concurrency limit enabled
+        if self.concurrency_limiter:
+            downloaded = self.concurrency_limiter.map(lambda args: self.download_page(*args), zip(page_urls, page_save_paths))
+        else:
+            downloaded = [self.download_page(*args) for args in zip(page_urls, page_save_paths)]
+
+        result = [path for path, ok in zip(page_save_paths, downloaded) if ok]
+        flag = all(downloaded)
 
         if flag:
             self.logger.info("Download illust {} all pages success.".format(illust_id))
@@ -0,0 +1,139 @@
+# -*- coding: UTF-8 -*-
+
+"""Pool of sessions for concurrent workers.
+
+Each worker session has its own connections and headers, while cookies are shared by a locked jar,
+and auth state (`SHARED_ATTRS` of session class, e.g. tokens of `AliyunDrive`) is synced through the pool.
+
+Example:
+    pool = SessionPool(xsession.get_session("aliyundrive"), size=4)
+    with ThreadPoolExecutor(4) as executor:
+        executor.map(lambda p: pool.run(lambda s: s.upload_file(p, "/pixiv")), paths)
+"""
+
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from requests.cookies import RequestsCookieJar
+from requests.structures import CaseInsensitiveDict
+
+from .base import XSession
+
+
+class LockedCookieJar(RequestsCookieJar):
+    """Cookie jar can be shared by sessions in different threads."""
+
+    def __iter__(self):
+        # iterate over a snapshot, so cookies can be set by other threads meanwhile
+        with self._cookies_lock:
+            cookies = list(super().__iter__())
+        return iter(cookies)
+
+    def copy(self):
+        new_jar = LockedCookieJar()
+        new_jar.set_policy(self.get_policy())
+        new_jar.update(self)
+        return new_jar
+
+
+class SessionPool:
+    """A fixed number of worker sessions cloned from a session.
+
+    Workers share rate limiter, retry policy, cache, metrics, circuit breaker and other thread-safe parts of the session,
+    use `acquire` or `run` to borrow one. Auth state changed by a worker (e.g. token refresh) is published
+    when it is returned or refreshed, and pulled by other workers before their next use.
+    The origin session is updated as well, it should not be used by other threads while pool is in use.
+    """
+
+    def __init__(self, session: XSession, size: int = 4) -> None:
+        """
+        Args:
+            session (XSession): Logged in session to clone, e.g. from `get_session`.
+            size (int): Number of worker sessions.
+        """
+        if not isinstance(session.cookies, LockedCookieJar):
+            jar = LockedCookieJar()
+            jar.update(session.cookies)
+            session.cookies = jar
+
+        self.session = session
+        self.size = size
+        self._lock = threading.Lock()
+        self._state = session.get_shared_state()
+        self._version = 0
+        self._synced: Dict[int, Tuple[int, dict]] = {}  # id of worker -> (version, state) last applied
+
+        self._workers: List[XSession] = [self._clone() for _ in range(size)]
+        self._idle: "queue.Queue[XSession]" = queue.Queue()
+        for worker in self._workers:
+            self._synced[id(worker)] = (0, self._state)
+            self._idle.put(worker)
+
+    def _clone(self) -> XSession:
+        """Clone session without calling `__init__`, so no network access."""
+
+        worker: XSession = object.__new__(type(self.session))
+        worker.__dict__.update(self.session.__dict__)
+
+        # own connection and request state
+        worker.headers = CaseInsensitiveDict(self.session.headers)
+        worker.proxies = dict(self.session.proxies)
+        worker.params = dict(self.session.params)
+        worker._local = threading.local()
+        worker._pool_configs = dict(self.session._pool_configs)
+        worker.adapters = OrderedDict()
+        for host in worker._pool_configs:
+            worker._mount_adapter(host)
+
+        worker.session_pool = self
+        return worker
+
+    def sync(self, worker: XSession) -> None:
+        """Apply latest shared state to a worker if it is outdated."""
+        with self._lock:
+            if self._synced[id(worker)][0] >= self._version:
+                return
+            state = self._state
+            self._synced[id(worker)] = (self._version, state)
+        worker.set_shared_state(state)
+
+    def publish(self, worker: XSession) -> None:
+        """Publish shared state of a worker if the worker changed it."""
+        state = worker.get_shared_state()
+        with self._lock:
+            # unchanged since last sync, maybe outdated but never overwrite newer state
+            if state == self._synced[id(worker)][1]:
+                return
+            self._version += 1
+            self._state = state
+            self._synced[id(worker)] = (self._version, state)
+        self.session.set_shared_state(state)
+
+    @contextmanager
+    def acquire(self, timeout: float = None) -> Iterator[XSession]:
+        """Borrow a worker session, wait if all are in use.
+
+        Raises:
+            queue.Empty: If no session is available in `timeout` seconds.
+        """
+        worker = self._idle.get(timeout=timeout)
+        try:
+            self.sync(worker)
+            yield worker
+        finally:
+            self.publish(worker)
+            self._idle.put(worker)
+
+    def run(self, func: Callable[[XSession], Any], *args, **kwargs) -> Any:
+        """Call `func(session, *args, **kwargs)` with a borrowed worker session."""
+        with self.acquire() as worker:
+            return func(worker, *args, **kwargs)
+
+    def close(self) -> None:
+        """Close connections of all workers, the origin session is not closed."""
+        for worker in self._workers:
+            for adapter in worker.adapters.values():
+                adapter.close()
@@ -0,0 +1,216 @@
+# -*- coding: UTF-8 -*-
+
+import logging
+import sqlite3
+import threading
+import time
+from fnmatch import fnmatchcase
+from os import PathLike
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """A thread-safe token bucket.
+
+    Tokens are refilled continuously at `rate` per second, up to `burst` tokens,
+    so idle time is banked instead of wasted.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """
+        Args:
+            rate (float): Tokens refilled per second, <= 0 means unlimited.
+            burst (int): Max tokens can be stored, at least 1.
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take tokens and return seconds need to wait before using them."""
+
+        if self.rate <= 0:
+            return 0
+
+        with self._lock:
+            self._refill(monotonic())
+            self._tokens -= tokens  # may go negative, which means queued reservation
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Block until tokens available.
+
+        Returns:
+            float: Seconds waited.
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+class SharedRateStore:
+    """Token buckets stored in a SQLite file, shared by processes on the same machine.
+
+    Each reservation is a short write transaction, so processes using the same key divide one budget.
+    Wall clock is used since monotonic clocks of processes may not be comparable.
+    """
+
+    def __init__(self, path: PathLike = "tmp/xsession_ratelimit.sqlite3", timeout: float = 10) -> None:
+        """
+        Args:
+            path (PathLike): SQLite file, created if not exist.
+            timeout (float): Seconds to wait for the lock of file.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path.as_posix(), timeout=timeout, isolation_level=None, check_same_thread=False)
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")  # readers never block, not supported by some file systems
+        except sqlite3.Error:
+            pass
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def reserve(self, key: str, rate: float, burst: int, tokens: float = 1) -> float:
+        """Take tokens from bucket of key and return seconds need to wait before using them.
+
+        Raises:
+            sqlite3.Error: If store is not available.
+        """
+        if rate <= 0:
+            return 0
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                now = time.time()
+                available = float(burst) if row is None else min(burst, row[0] + max(0, now - row[1]) * rate)
+                available -= tokens  # may go negative, which means queued reservation
+                self._conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, available, now))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return 0 if available >= 0 else -available / rate
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SharedTokenBucket(TokenBucket):
+    """A token bucket stored in a `SharedRateStore`, falls back to a local bucket if store failed."""
+
+    def __init__(self, store: SharedRateStore, key: str, rate: float, burst: int = 1) -> None:
+        super().__init__(rate, burst)
+        self.store = store
+        self.key = key
+
+    def reserve(self, tokens: float = 1) -> float:
+        try:
+            return self.store.reserve(self.key, self.rate, self.burst, tokens)
+        except sqlite3.Error as e:
+            logging.getLogger(__name__).warning("Shared rate limit of {} not available:{}".format(self.key, e))
+            return super().reserve(tokens)
+
+
+class RateLimiter:
+    """Per host rate limiter, each host has its own `TokenBucket`.
+
+    Limits are set by host patterns (support shell-style wildcards, e.g. `*.pximg.net`),
+    exact host is matched first, then patterns in the order they were set,
+    hosts not matched use the default limit.
+    """
+
+    def __init__(self, rate: float = 100, burst: int = 1) -> None:
+        """
+        Args:
+            rate (float): Default requests per second for each host, <= 0 means unlimited.
+            burst (int): Default burst size for each host.
+        """
+        self._limits: Dict[str, Tuple[float, int]] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.store: SharedRateStore = None
+        self.account = ""
+        self.default = (rate, burst)
+
+    @property
+    def default(self) -> Tuple[float, int]:
+        return self.__default
+
+    @default.setter
+    def default(self, value: Tuple[float, int]):
+        self.__default = value
+        self._reset_buckets()
+
+    def _reset_buckets(self) -> None:
+        """Drop created buckets, they will be re-created by new limits."""
+        with self._lock:
+            self._buckets.clear()
+
+    def set_limit(self, host: str, rate: float, burst: int = 1) -> None:
+        """Set rate limit of a host or host pattern.
+
+        Args:
+            host (str): Host name or pattern, e.g. "www.pixiv.net", "*.aliyundrive.net".
+            rate (float): Requests per second, <= 0 means unlimited.
+            burst (int): Max requests can be sent at once after idle.
+        """
+        self._limits[host] = (rate, burst)
+        self._reset_buckets()
+
+    def share(self, store: SharedRateStore, account: str = "") -> None:
+        """Store buckets of hosts with limits set in a store shared by processes, hosts with default limit stay local.
+
+        Args:
+            store (SharedRateStore): Store shared by processes.
+            account (str): Buckets are keyed by host and account, so different accounts have their own budgets.
+        """
+        self.store = store
+        self.account = account
+        self._reset_buckets()
+
+    def _match_limit(self, host: str) -> Optional[Tuple[float, int]]:
+        if host in self._limits:
+            return self._limits[host]
+        for pattern, limit in self._limits.items():
+            if fnmatchcase(host, pattern):
+                return limit
+        return None
+
+    def get_limit(self, host: str) -> Tuple[float, int]:
+        """Get (rate, burst) used by host."""
+        return self._match_limit(host) or self.default
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                limit = self._match_limit(host)
+                if limit is not None and self.store is not None:
+                    bucket = SharedTokenBucket(self.store, "{}@{}".format(self.account, host) if self.account else host, *limit)
+                else:
+                    bucket = TokenBucket(*(limit or self.default))
+                self._buckets[host] = bucket
+            return bucket
+
+    def acquire(self, host: str) -> float:
+        """Block until a request to host is allowed.
+
+        Returns:
+            float: Seconds waited.
+        """
+        return self.get_bucket(host).acquire()
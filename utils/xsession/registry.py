@@ -0,0 +1,139 @@
+# -*- coding: UTF-8 -*-
+
+"""Process-wide registry of shared sessions.
+
+Modules should get sessions by service name instead of creating new ones,
+so connections (and cookies) are reused in the whole process.
+
+Example:
+    s_pixiv = xsession.get_session("pixiv", headers={"User-Agent": "..."})
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable
+
+from .aliyundrive import AliyunDrive
+from .base import XSession
+from .bilibili import Bilibili
+from .kuwomusic import KuwoMusic
+from .pixiv import Pixiv
+
+logger = logging.getLogger(__name__)
+
+_factories: Dict[str, Callable[[], XSession]] = {
+    "pixiv": Pixiv,
+    "aliyundrive": AliyunDrive,
+    "bilibili": Bilibili,
+    "kuwomusic": KuwoMusic,
+}
+_sessions: Dict[str, XSession] = {}
+_creating: Dict[str, Future] = {}  # service -> session being created
+_lock = threading.Lock()
+
+
+def register(service: str, factory: Callable[[], XSession]) -> None:
+    """Register a factory of service, replace the old one."""
+    with _lock:
+        _factories[service] = factory
+
+
+def get_session(service: str, *, headers: dict = None, warm: bool = True) -> XSession:
+    """Get the shared session of a service, create it for the first time.
+
+    Args:
+        service (str): ["pixiv" | "aliyundrive" | "bilibili" | "kuwomusic"] or registered name.
+        headers (dict): Headers updated to session, also when session has been created (e.g. by `prewarm`).
+        warm (bool): Whether open a connection to `URL_www` of session when created.
+    """
+    with _lock:
+        session = _sessions.get(service)
+        if session is None:
+            if service not in _factories:
+                raise ValueError("Unknown service {}.".format(service))
+            future = _creating.get(service)
+            is_creator = future is None
+            if is_creator:
+                future = _creating[service] = Future()
+                factory = _factories[service]
+
+    if session is not None:
+        if headers:
+            session.headers.update(headers)
+        return session
+
+    if not is_creator:
+        # created by another thread, only wait for this service
+        session = future.result()
+        if headers:
+            session.headers.update(headers)
+        return session
+
+    # factory may send requests, e.g. KuwoMusic, so it runs outside lock
+    try:
+        session = factory()
+    except BaseException as e:
+        with _lock:
+            del _creating[service]
+        future.set_exception(e)
+        raise
+
+    if headers:
+        session.headers.update(headers)
+    with _lock:
+        _sessions[service] = session
+        del _creating[service]
+    future.set_result(session)
+
+    if warm and getattr(session, "URL_www", ""):
+        session.prewarm([session.URL_www])
+    return session
+
+
+def prewarm(targets: Dict[str, Iterable[str]]) -> threading.Thread:
+    """Open connections to hosts of services in background, create sessions if needed.
+
+    Args:
+        targets (Dict[str, Iterable[str]]): {"<service>": ["<host or url>", ...]}, see `XSession.prewarm`.
+
+    Returns:
+        Thread: Started thread, join it to wait for all connections.
+    """
+    def _prewarm():
+        def _prewarm_service(service: str):
+            hosts = list(targets[service])
+            session = get_session(service, warm=False)
+            results = session.prewarm(hosts)
+            logger.info("Prewarmed {}: {}".format(service, results))
+
+        with ThreadPoolExecutor(len(targets) or 1, thread_name_prefix="xsession-prewarm") as executor:
+            for future in [executor.submit(_prewarm_service, service) for service in targets]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning("Failed to prewarm:{}".format(e))
+
+    thread = threading.Thread(target=_prewarm, name="xsession-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def connection_stats() -> dict:
+    """Connection reuse statistics of all created sessions.
+
+    Returns:
+        {"<service>": XSession.connection_stats()}
+    """
+    with _lock:
+        sessions = dict(_sessions)
+    return {service: session.connection_stats() for service, session in sessions.items()}
+
+
+def close_all() -> None:
+    """Close and remove all created sessions."""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,304 @@
+# -*- coding: UTF-8 -*-
+
+"""Record and replay of http traffic, for offline benchmarks and regression tests.
+
+`ReplayAdapter` serves recorded responses by url pattern instead of network, with a latency and bandwidth model.
+Responses come from cassettes saved by a `Recorder`, or from fixtures in `responses` folder.
+
+Example:
+    # record
+    recorder = replay.Recorder()
+    replay.install(recorder=recorder)  # sessions created later record their traffic
+    bot.create_pixiv_ranking_dynamic(...)
+    recorder.save("tmp/bilibot.cassette.json")
+
+    # replay
+    adapter = replay.ReplayAdapter(latency=0.05, bandwidth=1024*1024)
+    adapter.load_cassette("tmp/bilibot.cassette.json")
+    replay.install(adapter)  # sessions created later never touch network
+    bot.create_pixiv_ranking_dynamic(...)
+    print(adapter.stats())
+
+Cassettes may contain tokens and cookies of responses, do not commit them.
+"""
+
+import base64
+import io
+import json
+import re
+import threading
+from os import PathLike
+from pathlib import Path
+from time import sleep
+from typing import Callable, Dict, Iterable, List, Optional, Union
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+FIXTURES_DIR = Path(__file__).with_name("responses")
+
+# headers not describing the recorded body
+_SKIP_HEADERS = frozenset(["content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"])
+
+
+class ReplayMissError(requests.exceptions.ConnectionError):
+    """Raised when no recorded response matches a request."""
+
+
+def _get_logical_url(request: requests.PreparedRequest) -> str:
+    """Url with `Host` header as its netloc, so domain fronted requests match their logical url."""
+    host = request.headers.get("Host")
+    if not host:
+        return request.url
+    components = list(urlsplit(request.url))
+    components[1] = host
+    return urlunsplit(components)
+
+
+def url_to_pattern(url: str) -> str:
+    """Make a regex of an url template, "{...}" matches a path segment, any query is allowed.
+
+    Examples:
+        "https://www.pixiv.net/ajax/illust/{illust_id}" ==> r"https://www\\.pixiv\\.net/ajax/illust/[^/?]+(?:\\?.*)?"
+    """
+    url = url.split("?")[0].rstrip("/")
+    pattern = re.sub(r"\\\{\w*\\\}", "[^/?]+", re.escape(url))
+    return pattern + r"/?(?:\?.*)?"
+
+
+class _Entry:
+    def __init__(self, method: Optional[str], pattern: str, status: int, headers: Dict[str, str], body: bytes) -> None:
+        self.method = method.upper() if method else None
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def match(self, method: str, url: str) -> bool:
+        return (self.method is None or self.method == method) and self.regex.fullmatch(url) is not None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_Entry":
+        if "body_base64" in data:
+            body = base64.b64decode(data["body_base64"])
+        else:
+            body = data.get("body", "").encode("utf8")
+        return cls(data.get("method"), data["url"], data.get("status", 200), data.get("headers", {}), body)
+
+    def to_dict(self) -> dict:
+        data = {"method": self.method, "url": self.pattern, "status": self.status, "headers": self.headers}
+        try:
+            data["body"] = self.body.decode("utf8")
+        except UnicodeDecodeError:
+            data["body_base64"] = base64.b64encode(self.body).decode("ascii")
+        return data
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Transport adapter serving recorded responses, never connects to network.
+
+    Entries are matched in order they were added, by method and regex of logical url (`Host` header first).
+    If several entries of the same pattern match, they are served in order and the last one is repeated.
+    Requests not matched raise `ReplayMissError`, i.e. an empty `Response` from `XSession`.
+
+    Each response is delayed by `latency + bytes / bandwidth`, where bytes are of request and response bodies,
+    and raises `ReadTimeout` if delay exceeds read timeout of request.
+    """
+
+    def __init__(self, *, latency: Union[float, Callable[[requests.PreparedRequest], float]] = 0, bandwidth: float = 0) -> None:
+        """
+        Args:
+            latency (Union[float, Callable]): Seconds before first byte, or a func of request returns it.
+            bandwidth (float): Bytes per second, <= 0 means unlimited.
+        """
+        super().__init__()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._lock = threading.Lock()
+        self._entries: List[_Entry] = []
+        self._served: Dict[str, int] = {}  # pattern -> times served
+        self._stats = {"hits": 0, "misses": 0}
+
+    def add(self, url_pattern: str, body: Union[bytes, str, dict, list] = b"", status: int = 200, headers: Dict[str, str] = None, method: str = None) -> None:
+        """Add a response.
+
+        Args:
+            url_pattern (str): Regex fully matches logical url, including query.
+            body (Union[bytes, str, dict, list]): Body, json is dumped.
+            method (str): Method to match, None means any.
+        """
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False)
+            headers.setdefault("Content-Type", "application/json; charset=utf-8")
+        if isinstance(body, str):
+            body = body.encode("utf8")
+        with self._lock:
+            self._entries.append(_Entry(method, url_pattern, status, headers, body))
+
+    def add_fixtures(self, session_class: type, folder: PathLike = None) -> int:
+        """Add fixtures of a session class, "<name>.json" is served for url template `URL_<name>` of class.
+
+        Fixture names are matched case insensitively, with its `URL_*` name or its url path,
+        e.g. "ajax_illust.json" for `URL_ajax_illust`, "x_web-interface_nav.json" for ".../x/web-interface/nav".
+
+        Args:
+            session_class (type): e.g. `PixivBase`.
+            folder (PathLike): Folder of fixtures, default to "responses/<service>" guessed from module of class.
+
+        Returns:
+            int: Number of fixtures added.
+        """
+        folder = Path(folder) if folder else FIXTURES_DIR.joinpath(session_class.__module__.rsplit(".", 1)[-1])
+        fixtures = {path.stem.lower(): path for path in folder.glob("*.json")}
+
+        count = 0
+        for name in dir(session_class):
+            url = getattr(session_class, name)
+            if not name.startswith("URL_") or not isinstance(url, str):
+                continue
+            path_name = "_".join(part for part in urlsplit(url).path.split("/") if part and "{" not in part)
+            for candidate in (name[4:].lower(), path_name.lower()):
+                if candidate in fixtures:
+                    self.add(url_to_pattern(url), fixtures[candidate].read_bytes(), headers={"Content-Type": "application/json; charset=utf-8"})
+                    count += 1
+                    break
+        return count
+
+    def load_cassette(self, path: PathLike) -> int:
+        """Add entries of a cassette saved by `Recorder`.
+
+        Returns:
+            int: Number of entries added.
+        """
+        entries = [_Entry.from_dict(data) for data in json.loads(Path(path).read_text("utf8"))]
+        with self._lock:
+            self._entries.extend(entries)
+        return len(entries)
+
+    def _match(self, method: str, url: str) -> Optional[_Entry]:
+        with self._lock:
+            matched = [entry for entry in self._entries if entry.match(method, url)]
+            if not matched:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+
+            # entries of the first matched pattern are served in order
+            pattern = matched[0].pattern
+            matched = [entry for entry in matched if entry.pattern == pattern]
+            served = self._served.get(pattern, 0)
+            self._served[pattern] = served + 1
+            return matched[min(served, len(matched) - 1)]
+
+    def _get_delay(self, request: requests.PreparedRequest, entry: _Entry) -> float:
+        delay = self.latency(request) if callable(self.latency) else self.latency
+        if self.bandwidth > 0:
+            body = request.body or b""
+            body_size = len(body) if isinstance(body, (bytes, str)) else int(request.headers.get("Content-Length", 0) or 0)
+            delay += (body_size + len(entry.body)) / self.bandwidth
+        return delay
+
+    def send(self, request: requests.PreparedRequest, stream=False, timeout=None, verify=True, cert=None, proxies=None) -> requests.Response:
+        url = _get_logical_url(request)
+        entry = self._match(request.method, url)
+        if entry is None:
+            raise ReplayMissError("No recorded response of {} {}".format(request.method, url), request=request)
+
+        delay = self._get_delay(request, entry)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout("Replayed read timed out. (read timeout={})".format(read_timeout), request=request)
+        if delay > 0:
+            sleep(delay)
+
+        headers = {**entry.headers, "Content-Length": str(len(entry.body))}
+        raw = HTTPResponse(
+            body=io.BytesIO(entry.body), headers=headers, status=entry.status,
+            preload_content=False, decode_content=False, request_method=request.method
+        )
+        return self.build_response(request, raw)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {"hits": int, "misses": int, "entries": int}
+        """
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
+
+
+class Recorder:
+    """Collects responses of real traffic into a cassette, only complete (not stream) responses are recorded."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: List[_Entry] = []
+
+    def record(self, request: requests.PreparedRequest, res: requests.Response) -> None:
+        headers = {k: v for k, v in res.headers.items() if k.lower() not in _SKIP_HEADERS}
+        entry = _Entry(request.method, re.escape(_get_logical_url(request)), res.status_code, headers, res.content or b"")
+        with self._lock:
+            self._entries.append(entry)
+
+    def save(self, path: PathLike) -> int:
+        """Save recorded entries as a cassette file.
+
+        Returns:
+            int: Number of entries saved.
+        """
+        with self._lock:
+            data = [entry.to_dict() for entry in self._entries]
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=4), "utf8")
+        return len(data)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """`HTTPAdapter` records its responses into a `Recorder`."""
+
+    def __init__(self, recorder: Recorder, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.recorder = recorder
+
+    def send(self, request: requests.PreparedRequest, stream=False, *args, **kwargs) -> requests.Response:
+        res = super().send(request, stream, *args, **kwargs)
+        if not stream:
+            res.content  # load content to record it, same as what session does
+            self.recorder.record(request, res)
+        return res
+
+
+def install(adapter: ReplayAdapter = None, recorder: Recorder = None) -> None:
+    """Set replay adapter or recorder used by sessions created later, None to restore network.
+
+    Existing sessions can use `XSession.enable_replay` and `XSession.enable_recording`.
+    """
+    from .base import XSession
+
+    XSession.default_replay = adapter
+    XSession.default_recorder = recorder
+
+
+def fixtures_adapter(session_classes: Iterable[type] = None, **kwargs) -> ReplayAdapter:
+    """Make a replay adapter serving fixtures of session classes, None means all services.
+
+    Args:
+        kwargs: Args of `ReplayAdapter`.
+    """
+    if session_classes is None:
+        from .aliyundrive import AliyunDriveBase
+        from .bilibili import BilibiliBase
+        from .kuwomusic import KuwoMusicBase
+        from .pixiv import PixivBase
+        session_classes = [AliyunDriveBase, BilibiliBase, KuwoMusicBase, PixivBase]
+
+    adapter = ReplayAdapter(**kwargs)
+    for session_class in session_classes:
+        adapter.add_fixtures(session_class)
+    return adapter
@@ -0,0 +1,128 @@
+# -*- coding: UTF-8 -*-
+
+import inspect
+import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+import requests
+from urllib3.util.retry import Retry
+
+
+class _JitterRetry(Retry):
+    """urllib3 `Retry` with full jitter backoff."""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+# urllib3 renamed `method_whitelist` to `allowed_methods` in 1.26
+_ALLOWED_METHODS_ARG = "allowed_methods" if "allowed_methods" in inspect.signature(Retry.__init__).parameters else "method_whitelist"
+
+
+class RetryPolicy:
+    """Retry policy shared by `XSession` adapters and `false_retry`.
+
+    Backoff is exponential with full jitter: `uniform(0, min(backoff_max, backoff_base * 2 ** attempt))`,
+    a `Retry-After` header on 429/503 responses overrides it when larger.
+    """
+
+    SAFE_METHODS = frozenset(["HEAD", "GET", "OPTIONS", "TRACE"])
+    RETRY_STATUS = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        backoff_base: float = 1,
+        backoff_max: float = 60,
+        total_time: float = 300,
+        *,
+        status_forcelist: Iterable[int] = RETRY_STATUS,
+        allowed_methods: Iterable[str] = SAFE_METHODS,
+        respect_retry_after: bool = True
+    ) -> None:
+        """
+        Args:
+            max_retries (int): Max retry times.
+            backoff_base (float): Backoff seconds of first retry, doubled each retry.
+            backoff_max (float): Max backoff seconds of a single retry.
+            total_time (float): Max seconds spent on a retry loop, <= 0 means no limit.
+            status_forcelist (Iterable[int]): Status codes should be retried.
+            allowed_methods (Iterable[str]): Methods can be retried after request sent, default to safe methods only.
+                Connection errors are always retried because request is not sent.
+            respect_retry_after (bool): Whether wait for `Retry-After` header.
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.total_time = total_time
+        self.status_forcelist = frozenset(status_forcelist)
+        self.allowed_methods = frozenset(m.upper() for m in allowed_methods)
+        self.respect_retry_after = respect_retry_after
+
+    def copy(self, **kwargs) -> "RetryPolicy":
+        """Return a copy with some fields replaced."""
+        params = {
+            "max_retries": self.max_retries,
+            "backoff_base": self.backoff_base,
+            "backoff_max": self.backoff_max,
+            "total_time": self.total_time,
+            "status_forcelist": self.status_forcelist,
+            "allowed_methods": self.allowed_methods,
+            "respect_retry_after": self.respect_retry_after,
+        }
+        params.update(kwargs)
+        return RetryPolicy(**params)
+
+    def get_backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry.
+
+        Args:
+            attempt (int): Times already retried, start from 0.
+            retry_after (float): Seconds from `Retry-After` header.
+        """
+        backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if self.respect_retry_after and retry_after is not None:
+            backoff = max(backoff, retry_after)
+        return backoff
+
+    def get_retry_after(self, res: requests.Response) -> Optional[float]:
+        """Parse `Retry-After` header of a 429/503 response, return None if not exist."""
+
+        if res.status_code not in (429, 503):
+            return None
+
+        value = res.headers.get("Retry-After")
+        if not value:
+            return None
+
+        try:
+            return max(0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return max(0, (date - datetime.now(timezone.utc)).total_seconds())
+
+    def is_retryable(self, method: str, status_code: int) -> bool:
+        """Whether a sent request should be retried."""
+        return method.upper() in self.allowed_methods and status_code in self.status_forcelist
+
+    def to_urllib3(self) -> Retry:
+        """Make a urllib3 `Retry` used by `HTTPAdapter`."""
+
+        return _JitterRetry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_base,
+            status_forcelist=self.status_forcelist,
+            raise_on_status=False,
+            respect_retry_after_header=self.respect_retry_after,
+            **{_ALLOWED_METHODS_ARG: self.allowed_methods}
+        )
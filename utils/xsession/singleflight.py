@@ -0,0 +1,95 @@
+# -*- coding: UTF-8 -*-
+
+import threading
+from time import monotonic
+from typing import Any, Callable, Dict
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException = None
+        self.expires = 0.0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one call.
+
+    Callers arriving while a call is in flight wait and share its result,
+    results can also be memoized for `memo_time` seconds after the call finished.
+    """
+
+    def __init__(self, memo_time: float = 0, memo_filter: Callable[[Any], bool] = bool) -> None:
+        """
+        Args:
+            memo_time (float): Seconds to keep results after call finished, <= 0 means only share in-flight calls.
+            memo_filter (Callable[[Any], bool]): Whether a result can be memoized, e.g. skip failed results.
+        """
+        self.memo_time = memo_time
+        self.memo_filter = memo_filter
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {"calls": 0, "shared": 0, "memo_hits": 0}
+
+    def _prune(self, now: float) -> None:
+        """Remove expired memos, need lock."""
+        for key in [k for k, c in self._calls.items() if c.done.is_set() and c.expires <= now]:
+            del self._calls[key]
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """Call func, or share result of the same key."""
+
+        with self._lock:
+            now = monotonic()
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and call.expires <= now:
+                call = None
+
+            if call is None:
+                if len(self._calls) >= 1024:
+                    self._prune(now)
+                call = self._calls[key] = _Call()
+                leader = True
+                self._stats["calls"] += 1
+            else:
+                leader = False
+                self._stats["memo_hits" if call.done.is_set() else "shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            memo = call.error is None and self.memo_time > 0 and self.memo_filter(call.result)
+            call.expires = monotonic() + self.memo_time if memo else 0
+            call.done.set()
+            if not memo:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+
+        return call.result
+
+    def forget(self, key: str = None) -> None:
+        """Drop memo of a key, None means all."""
+        with self._lock:
+            if key is None:
+                self._calls = {k: c for k, c in self._calls.items() if not c.done.is_set()}
+            elif key in self._calls and self._calls[key].done.is_set():
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {"calls": int, "shared": int, "memo_hits": int}
+        """
+        with self._lock:
+            return dict(self._stats)
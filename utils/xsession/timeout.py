@@ -0,0 +1,134 @@
+# -*- coding: UTF-8 -*-
+
+"""Adaptive timeouts and deadlines of requests.
+
+A deadline is set by a top-level job, and respected by all requests, retry loops and retry sleeps in it:
+
+    with deadline(55 * 60):
+        drive.upload_file(...)
+
+Deadline is stored in a `contextvars.ContextVar`, so it follows asyncio tasks,
+and is copied to worker threads started by sessions (segments, hedging, `AsyncXSession`).
+"""
+
+import contextvars
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+import requests
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar("xsession_deadline", default=None)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when a request is refused because deadline has passed."""
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[float]:
+    """Set a deadline `seconds` from now, a nested deadline can only be earlier than outer one.
+
+    Yields:
+        float: Deadline in `time.monotonic` clock.
+    """
+    at = monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        at = min(at, outer)
+    token = _deadline.set(at)
+    try:
+        yield at
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left to current deadline, None if no deadline, may be negative."""
+    at = _deadline.get()
+    return None if at is None else at - monotonic()
+
+
+def is_expired() -> bool:
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+def cap_timeout(timeout: Union[Tuple[float, float], float, None]) -> Union[Tuple[float, float], float, None]:
+    """Cap timeout by remaining time of current deadline.
+
+    Raises:
+        DeadlineExceeded: If deadline has passed.
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded.")
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+
+class AdaptiveTimeout:
+    """Per host timeouts scaled with request body size and observed upload throughput.
+
+    Read timeout of a request is `read + slack * body_size / throughput`, where throughput is
+    the moving average of uploads to the host, or `min_throughput` before any upload observed.
+    Small requests keep the base read timeout.
+    """
+
+    def __init__(
+        self,
+        connect: float = 10,
+        read: float = 30,
+        *,
+        min_throughput: float = 64*1024,
+        slack: float = 4,
+        max_read: float = 600,
+        min_sample_size: int = 256*1024,
+        alpha: float = 0.3
+    ) -> None:
+        """
+        Args:
+            connect (float): Connect timeout.
+            read (float): Base read timeout, i.e. time for server to respond.
+            min_throughput (float): Bytes per second assumed before any upload to the host observed.
+            slack (float): Times of expected upload time allowed.
+            max_read (float): Max read timeout.
+            min_sample_size (int): Min body bytes of a request to observe throughput.
+            alpha (float): Weight of latest sample in moving average.
+        """
+        self.connect = connect
+        self.read = read
+        self.min_throughput = min_throughput
+        self.slack = slack
+        self.max_read = max_read
+        self.min_sample_size = min_sample_size
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._throughputs: Dict[str, float] = {}  # host -> bytes per second
+
+    def get(self, host: str, body_size: int = 0) -> Tuple[float, float]:
+        """(connect, read) timeout of a request to host."""
+        with self._lock:
+            throughput = self._throughputs.get(host, self.min_throughput)
+        read = self.read + self.slack * body_size / max(throughput, 1)
+        return (self.connect, min(self.max_read, read))
+
+    def observe(self, host: str, body_size: int, elapsed: float) -> None:
+        """Observe a successful request, only uploads of at least `min_sample_size` bytes are counted."""
+        if body_size < self.min_sample_size or elapsed <= 0:
+            return
+        throughput = body_size / elapsed
+        with self._lock:
+            average = self._throughputs.get(host)
+            self._throughputs[host] = throughput if average is None else average + self.alpha * (throughput - average)
+
+    def stats(self) -> Dict[str, float]:
+        """{"<host>": bytes per second}"""
+        with self._lock:
+            return dict(self._throughputs)